@@ -0,0 +1,94 @@
+"""
+Database query instrumentation.
+
+A sample of requests run with an execute wrapper on every connection
+that counts their queries, totals the time spent in the database and
+keeps the slowest statements. The totals are sent back in a
+Server-Timing header and logged as one JSON line per request, unsampled
+requests don't pay for any of it.
+"""
+import heapq
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('core.queries')
+
+# long statements are cut down before they are logged.
+MAX_SQL_LENGTH = 500
+
+
+class QueryRecorder:
+    """Execute wrapper recording the queries of one request."""
+
+    def __init__(self, slowest=5):
+        self.count = 0
+        self.duration = 0.0
+        self.keep = slowest
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            # a min-heap of the slowest, only their text is kept, the
+            # parameters may hold personal data.
+            query = (duration, sql[:MAX_SQL_LENGTH])
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, query)
+            elif self.keep:
+                heapq.heappushpop(self.slowest, query)
+
+    def get_slowest(self):
+        """Return the slowest statements, slowest first."""
+        return [{'ms': round(duration * 1000, 2), 'sql': sql}
+                for duration, sql in sorted(self.slowest, reverse=True)]
+
+
+class QueryInstrumentationMiddleware:
+    """Instrument a sample of requests with their database queries.
+
+    Only queries run while the view builds its response are recorded,
+    a streamed body queries after the middleware has returned.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = settings.QUERY_INSTRUMENTATION_SAMPLE_RATE
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(settings.QUERY_INSTRUMENTATION_SLOWEST)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        db_ms = recorder.duration * 1000
+        total_ms = duration * 1000
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.2f};desc="{recorder.count} queries", '
+            f'total;dur={total_ms:.2f}')
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(db_ms, 2),
+            'total_ms': round(total_ms, 2),
+            'slowest': recorder.get_slowest(),
+        }))
+        return response
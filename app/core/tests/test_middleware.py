@@ -0,0 +1,67 @@
+"""
+Tests for the query instrumentation middleware.
+"""
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+
+from core.middleware import QueryInstrumentationMiddleware, QueryRecorder
+
+
+def list_users(request):
+    """View running one query per user plus the listing."""
+    users = list(get_user_model().objects.all())
+    for user in users:
+        get_user_model().objects.filter(pk=user.pk).exists()
+    return HttpResponse(status=200)
+
+
+class QueryInstrumentationTests(TestCase):
+    """Test the query instrumentation middleware."""
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/shop/products')
+        self.middleware = QueryInstrumentationMiddleware(list_users)
+        for n in range(2):
+            get_user_model().objects.create_user(
+                email=f'user{n}@example.com', password='test123')
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        """Test sampled requests get timings and a structured log."""
+        with self.assertLogs('core.queries', level='INFO') as logs:
+            response = self.middleware(self.request)
+
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['path'], '/api/shop/products')
+        self.assertEqual(entry['status'], 200)
+        self.assertEqual(entry['queries'], 3)
+        self.assertEqual(len(entry['slowest']), 3)
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_request(self):
+        """Test unsampled requests are left alone."""
+        with self.assertNoLogs('core.queries'):
+            response = self.middleware(self.request)
+
+        self.assertNotIn('Server-Timing', response)
+
+    @patch('core.middleware.time.perf_counter')
+    def test_recorder_keeps_slowest(self, patched_clock):
+        """Test only the slowest statements are kept, slowest first."""
+        recorder = QueryRecorder(slowest=2)
+        # each query reads the clock before and after it runs.
+        patched_clock.side_effect = [0.0, 1.0, 0.0, 3.0, 0.0, 2.0]
+
+        for sql in ('a', 'b', 'c'):
+            recorder(lambda *args: None, sql, None, False, {})
+
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(recorder.duration, 6.0)
+        self.assertEqual(
+            recorder.get_slowest(),
+            [{'ms': 3000.0, 'sql': 'b'}, {'ms': 2000.0, 'sql': 'c'}])
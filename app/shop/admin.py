@@ -1,12 +1,52 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from shop import models
+from shop.fulfilment import (
+    PROCESSING,
+    DISPATCHED,
+    DELIVERED,
+    transition_orders,
+)
 # Register your models here.
 
+
+def move_orders(modeladmin, request, queryset, from_status, to_status):
+    """Move the selected orders on and report what was skipped."""
+    updated, skipped = transition_orders(
+        queryset.values_list('id', flat=True), from_status, to_status)
+    modeladmin.message_user(
+        request, f'{len(updated)} orders marked {to_status}.')
+    if skipped:
+        modeladmin.message_user(
+            request,
+            f'{len(skipped)} orders were skipped as they are not '
+            f'{from_status}: {", ".join(map(str, skipped))}',
+            messages.WARNING)
+
+
+@admin.action(description=f'Mark selected orders {DISPATCHED}')
+def mark_dispatched(modeladmin, request, queryset):
+    """Move the selected orders from processing to dispatched."""
+    move_orders(modeladmin, request, queryset, PROCESSING, DISPATCHED)
+
+
+@admin.action(description=f'Mark selected orders {DELIVERED}')
+def mark_delivered(modeladmin, request, queryset):
+    """Move the selected orders from dispatched to delivered."""
+    move_orders(modeladmin, request, queryset, DISPATCHED, DELIVERED)
+
+
+class OrderAdmin(admin.ModelAdmin):
+    """Define the admin pages for orders."""
+    list_display = ['id', 'email', 'delivery_status', 'date_ordered']
+    list_filter = ['delivery_status']
+    actions = [mark_dispatched, mark_delivered]
+
+
 admin.site.register(models.Product)
 admin.site.register(models.Cart)
 admin.site.register(models.CartItem)
-admin.site.register(models.Order)
+admin.site.register(models.Order, OrderAdmin)
 admin.site.register(models.OrderItem)
 admin.site.register(models.OrderList)
 admin.site.register(models.UserDeliveryInfo)
@@ -0,0 +1,258 @@
+"""
+Sales analytics for the shop.
+
+Order history is rolled up into one DailySales row per day as orders
+are placed, so analytics read O(days) rows instead of every order. The
+rollup is written after each checkout commits, so checkouts don't queue
+on the lock of the day's row. The rollup can be rebuilt from the
+orders with the rebuild_daily_sales command if it ever drifts, e.g.
+after orders are edited or deleted or a process dies between a commit
+and its rollup.
+
+Results are cached under the analytics and catalog versions, which
+every order or product write bumps, in a database cache shared by every
+worker. Concurrent misses for the same result, in any worker, queue on
+a Postgres advisory lock and only the first computes it.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from shop import models
+
+ANALYTICS_VERSION_ID = 1
+ANALYTICS_CACHE_KEY = 'shop:analytics:{version}:{name}:{params}'
+# held until the transaction computing a result commits it.
+COMPUTE_LOCK_SQL = 'SELECT pg_advisory_xact_lock(%s)'
+
+GRANULARITIES = ['day', 'week', 'month', 'year']
+# approximate days per bucket, to guess how many buckets a range makes.
+GRANULARITY_DAYS = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+DEFAULT_RANGE = timedelta(days=29)
+# longer ranges are summed from the daily rollup instead of the orders.
+ROLLUP_AFTER_DAYS = 92
+# finer granularities are coarsened so a series stays chartable.
+MAX_BUCKETS = 400
+
+# adds to the day's totals, creating the row for a new day.
+RECORD_SALES_SQL = """
+INSERT INTO shop_dailysales (date, order_count, revenue, items_sold)
+VALUES (%(date)s, %(order_count)s, %(revenue)s, %(items_sold)s)
+ON CONFLICT (date) DO UPDATE
+    SET order_count = shop_dailysales.order_count + EXCLUDED.order_count,
+        revenue = shop_dailysales.revenue + EXCLUDED.revenue,
+        items_sold = shop_dailysales.items_sold + EXCLUDED.items_sold
+"""
+
+# items are summed per order first so revenue isn't counted per item.
+REBUILD_DAILY_SALES_SQL = """
+INSERT INTO shop_dailysales (date, order_count, revenue, items_sold)
+SELECT orders.date_ordered, COUNT(*), SUM(orders.total_price),
+       COALESCE(SUM(items.quantity), 0)
+FROM shop_order orders
+LEFT JOIN (
+    SELECT link.order_id, SUM(item.quantity) AS quantity
+    FROM shop_order_order link
+    JOIN shop_orderitem item ON item.id = link.orderitem_id
+    GROUP BY link.order_id
+) items ON items.order_id = orders.id
+WHERE (%(date_from)s::date IS NULL OR orders.date_ordered >= %(date_from)s)
+  AND (%(date_to)s::date IS NULL OR orders.date_ordered <= %(date_to)s)
+GROUP BY orders.date_ordered
+"""
+
+RANKINGS = {'units': 'units', 'orders': 'orders', 'revenue': 'revenue'}
+
+# sums every product's sales and ranks them both ways in the database,
+# only the top and bottom n rows are sent back.
+POPULARITY_SQL = """
+WITH sales AS (
+    SELECT item.product_id,
+           SUM(item.quantity) AS units,
+           COUNT(DISTINCT link.order_id) AS orders
+    FROM shop_orderitem item
+    JOIN shop_order_order link ON link.orderitem_id = item.id
+    JOIN shop_order orders ON orders.id = link.order_id
+    WHERE (%(date_from)s::date IS NULL OR orders.date_ordered >= %(date_from)s)
+      AND (%(date_to)s::date IS NULL OR orders.date_ordered <= %(date_to)s)
+    GROUP BY item.product_id
+), totals AS (
+    SELECT product.id,
+           COALESCE(sales.units, 0) AS units,
+           COALESCE(sales.orders, 0) AS orders,
+           COALESCE(sales.units, 0) * product.price AS revenue
+    FROM shop_product product
+    LEFT JOIN sales ON sales.product_id = product.id
+), ranked AS (
+    SELECT totals.*,
+           ROW_NUMBER() OVER (ORDER BY {ranking} DESC, id) AS top_rank,
+           ROW_NUMBER() OVER (ORDER BY {ranking}, id) AS bottom_rank
+    FROM totals
+)
+SELECT product.id, product.name, product.image_url, product.price,
+       product.description_short, product.description_long,
+       product.catagory,
+       ranked.units, ranked.orders, ranked.revenue,
+       ranked.top_rank, ranked.bottom_rank
+FROM ranked
+JOIN shop_product product ON product.id = ranked.id
+WHERE ranked.top_rank <= %(n)s OR ranked.bottom_rank <= %(n)s
+"""
+
+
+def get_analytics_version():
+    """Return the current analytics version."""
+    version = models.AnalyticsVersion.objects\
+        .filter(pk=ANALYTICS_VERSION_ID)\
+        .values_list('version', flat=True)\
+        .first()
+    return version or 0
+
+
+def bump_analytics_version():
+    """Move the analytics on to a new version."""
+    updated = models.AnalyticsVersion.objects\
+        .filter(pk=ANALYTICS_VERSION_ID)\
+        .update(version=F('version') + 1)
+    if not updated:
+        models.AnalyticsVersion.objects.get_or_create(
+            pk=ANALYTICS_VERSION_ID,
+            defaults={'version': 1})
+
+
+def get_cached(name, params, compute):
+    """Return ``compute()`` cached for ``name`` and ``params``.
+
+    Only the first miss runs ``compute``, the others wait on its lock
+    and read the result it stored.
+    """
+    # default ranges end today, so today is part of every key.
+    params = json.dumps(
+        {'params': params, 'today': timezone.localdate()},
+        sort_keys=True,
+        cls=DjangoJSONEncoder)
+    key = ANALYTICS_CACHE_KEY.format(
+        version=get_analytics_version(),
+        name=name,
+        params=hashlib.md5(params.encode()).hexdigest())
+    cache = caches['analytics']
+    result = cache.get(key)
+    if result is not None:
+        return result
+    lock_id = int.from_bytes(
+        hashlib.md5(key.encode()).digest()[:8], 'big', signed=True)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(COMPUTE_LOCK_SQL, [lock_id])
+        # filled by whoever held the lock before us.
+        result = cache.get(key)
+        if result is None:
+            result = compute()
+            cache.set(key, result, settings.SHOP_ANALYTICS_CACHE_TTL)
+    return result
+
+
+def record_sales(date, order_count=0, revenue=0, items_sold=0):
+    """Add to the sales rolled up for ``date``.
+
+    The analytics version is bumped after the rollup is written, so a
+    result cached under the new version always includes these sales.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_SALES_SQL, {
+            'date': date,
+            'order_count': order_count,
+            'revenue': revenue,
+            'items_sold': items_sold,
+        })
+    bump_analytics_version()
+
+
+def rebuild_daily_sales(date_from=None, date_to=None):
+    """Recompute the rollup from the orders, return the days written."""
+    with transaction.atomic():
+        days = models.DailySales.objects.all()
+        if date_from:
+            days = days.filter(date__gte=date_from)
+        if date_to:
+            days = days.filter(date__lte=date_to)
+        days._raw_delete(days.db)
+        with connection.cursor() as cursor:
+            cursor.execute(REBUILD_DAILY_SALES_SQL, {
+                'date_from': date_from,
+                'date_to': date_to,
+            })
+            rebuilt = cursor.rowcount
+        bump_analytics_version()
+    return rebuilt
+
+
+def get_sales_series(date_from=None, date_to=None, granularity='day'):
+    """Return the orders and revenue per period between two days.
+
+    Short ranges are read from the orders through the date_ordered
+    index, longer ones from the daily rollup, and granularities that
+    would make more than MAX_BUCKETS buckets are coarsened. Periods
+    without orders are left out.
+    """
+    date_to = date_to or timezone.localdate()
+    date_from = date_from or date_to - DEFAULT_RANGE
+    days = (date_to - date_from).days + 1
+    position = GRANULARITIES.index(granularity)
+    # years are the coarsest, longer ranges are rejected by the API.
+    while days / GRANULARITY_DAYS[GRANULARITIES[position]] > MAX_BUCKETS \
+            and position < len(GRANULARITIES) - 1:
+        position += 1
+    granularity = GRANULARITIES[position]
+
+    if days > ROLLUP_AFTER_DAYS:
+        source = 'daily_sales'
+        sales = models.DailySales.objects\
+            .filter(date__range=(date_from, date_to))\
+            .annotate(period=Trunc('date', granularity,
+                                   output_field=DateField()))\
+            .values('period')\
+            .annotate(orders=Sum('order_count'), revenue=Sum('revenue'))
+    else:
+        source = 'orders'
+        sales = models.Order.objects\
+            .filter(date_ordered__range=(date_from, date_to))\
+            .annotate(period=Trunc('date_ordered', granularity,
+                                   output_field=DateField()))\
+            .values('period')\
+            .annotate(orders=Count('id'), revenue=Sum('total_price'))
+    return {
+        'from': date_from,
+        'to': date_to,
+        'granularity': granularity,
+        'source': source,
+        'series': list(sales.order_by('period')),
+    }
+
+
+def get_popularity(n=10, by='units', date_from=None, date_to=None):
+    """Return the n most and least popular products.
+
+    Popularity is by units sold, orders or revenue at the current
+    price. Products are annotated with ``units``, ``orders``,
+    ``revenue`` and their ``top_rank``/``bottom_rank``.
+    """
+    products = list(models.Product.objects.raw(
+        POPULARITY_SQL.format(ranking=RANKINGS[by]),
+        {'n': n, 'date_from': date_from, 'date_to': date_to}))
+    return {
+        'top': sorted(
+            [product for product in products if product.top_rank <= n],
+            key=lambda product: product.top_rank),
+        'bottom': sorted(
+            [product for product in products if product.bottom_rank <= n],
+            key=lambda product: product.bottom_rank),
+    }
@@ -0,0 +1,183 @@
+"""
+Cart helpers shared by the cart and checkout views
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import (
+    F,
+    Sum,
+    OuterRef,
+    Subquery,
+    DecimalField,
+    ExpressionWrapper,
+)
+
+from shop import models
+from shop.serializers import CartItemReadSerializer
+from shop.sparse import narrow_queryset
+
+# inserts the item or adds to its quantity, bumps the cart version and
+# returns the item with its product, all in one round trip.
+ADD_TO_CART_SQL = """
+WITH cart_item AS (
+    INSERT INTO shop_cartitem (user_id, product_id, quantity)
+    SELECT %(user_id)s, id, %(quantity)s
+    FROM shop_product
+    WHERE id = %(product_id)s
+    ON CONFLICT (user_id, product_id) DO UPDATE
+        SET quantity = shop_cartitem.quantity + EXCLUDED.quantity
+    RETURNING id, product_id, quantity
+), cart AS (
+    UPDATE shop_cart
+    SET version = version + 1
+    WHERE user_id = %(user_id)s AND EXISTS (SELECT 1 FROM cart_item)
+)
+SELECT product.id, product.name, product.image_url, product.price,
+       product.description_short, product.description_long,
+       product.catagory,
+       cart_item.id AS cart_item_id,
+       cart_item.quantity AS cart_item_quantity,
+       cart_item.quantity * product.price AS cart_item_line_total
+FROM cart_item
+JOIN shop_product product ON product.id = cart_item.product_id
+"""
+
+LINE_TOTAL = ExpressionWrapper(
+    F('quantity') * F('product__price'),
+    output_field=DecimalField(max_digits=12, decimal_places=2))
+
+# adds to the quantity of many items at once, creating missing ones.
+ADD_CART_ITEMS_SQL = """
+INSERT INTO shop_cartitem (user_id, product_id, quantity)
+SELECT %(user_id)s, item.product_id, item.quantity
+FROM unnest(%(product_ids)s::bigint[], %(quantities)s::integer[])
+    AS item(product_id, quantity)
+ON CONFLICT (user_id, product_id) DO UPDATE
+    SET quantity = shop_cartitem.quantity + EXCLUDED.quantity
+"""
+
+
+def read_cart(user, sparse=None):
+    """Return the user's cart id and its serialized items.
+
+    The items, their products and the cart id are read with one JOIN
+    query, only an empty cart needs a second lookup for its id.
+    """
+    sparse = sparse or {}
+    cart_items = narrow_queryset(
+        models.CartItem.objects.filter(user=user).order_by('id'),
+        CartItemReadSerializer(**sparse))
+    cart_items = list(cart_items.annotate(
+        line_total=LINE_TOTAL,
+        cart_id=Subquery(
+            models.Cart.objects
+            .filter(user=OuterRef('user'))
+            .values('id')[:1])))
+    if cart_items:
+        cart_id = cart_items[0].cart_id
+    else:
+        cart_id = models.Cart.objects\
+            .filter(user=user)\
+            .values_list('id', flat=True)\
+            .first()
+    serializer = CartItemReadSerializer(cart_items, many=True, **sparse)
+    return cart_id, serializer.data
+
+
+def get_cart_totals(user):
+    """Return the number of units and the total price of a cart."""
+    totals = models.CartItem.objects\
+        .filter(user=user)\
+        .aggregate(item_count=Sum('quantity'), total=Sum(LINE_TOTAL))
+    return {
+        'item_count': totals['item_count'] or 0,
+        'total': totals['total'] or Decimal('0.00'),
+    }
+
+
+def get_cart_version(user):
+    """Return the version of the user's cart."""
+    version = models.Cart.objects\
+        .filter(user=user)\
+        .values_list('version', flat=True)\
+        .first()
+    return version or 0
+
+
+def bump_cart_version(user_id):
+    """Move the user's cart on to a new version."""
+    models.Cart.objects\
+        .filter(user_id=user_id)\
+        .update(version=F('version') + 1)
+
+
+def add_to_cart(user_id, product_id, quantity):
+    """Add a product to the user's cart and return it.
+
+    The product is annotated with ``cart_item_id``,
+    ``cart_item_quantity`` and ``cart_item_line_total``, None is
+    returned if it doesn't exist.
+    """
+    products = models.Product.objects.raw(ADD_TO_CART_SQL, {
+        'user_id': user_id,
+        'product_id': product_id,
+        'quantity': quantity,
+    })
+    return next(iter(products), None)
+
+
+def fold_cart_operations(operations):
+    """Collapse ordered add/set/remove operations into one per product.
+
+    Returns the quantities to add, the quantities to set and the
+    products to remove.
+    """
+    adds, sets, removes = {}, {}, set()
+    for operation in operations:
+        product = operation['product']
+        quantity = operation.get('quantity', 0)
+        if operation['op'] == 'add' and product in sets:
+            sets[product] += quantity
+        elif operation['op'] == 'add' and product in removes:
+            removes.discard(product)
+            sets[product] = quantity
+        elif operation['op'] == 'add':
+            adds[product] = adds.get(product, 0) + quantity
+        elif operation['op'] == 'set' and quantity > 0:
+            adds.pop(product, None)
+            removes.discard(product)
+            sets[product] = quantity
+        else:
+            adds.pop(product, None)
+            sets.pop(product, None)
+            removes.add(product)
+    return adds, sets, removes
+
+
+def apply_cart_operations(user_id, operations):
+    """Apply a batch of cart operations in one transaction."""
+    adds, sets, removes = fold_cart_operations(operations)
+    with transaction.atomic():
+        if removes:
+            items = models.CartItem.objects.filter(
+                user_id=user_id, product_id__in=removes)
+            # the cart version is bumped once below, not per item.
+            items._raw_delete(items.db)
+        if adds:
+            with connection.cursor() as cursor:
+                cursor.execute(ADD_CART_ITEMS_SQL, {
+                    'user_id': user_id,
+                    'product_ids': list(adds),
+                    'quantities': list(adds.values()),
+                })
+        if sets:
+            models.CartItem.objects.bulk_create(
+                [models.CartItem(user_id=user_id, product_id=product,
+                                 quantity=quantity)
+                 for product, quantity in sets.items()],
+                update_conflicts=True,
+                unique_fields=['user', 'product'],
+                update_fields=['quantity'],
+                )
+        bump_cart_version(user_id)
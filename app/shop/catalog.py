@@ -0,0 +1,114 @@
+"""
+Versioned snapshots of the product catalog.
+
+The catalog only changes when staff write products, so the rendered
+JSON for the whole catalog and its category counts are cached under the
+current catalog version.
+Every product write bumps the version, which makes the old snapshot
+unreachable instead of having to delete it. Bulk writes bump it once
+per batch rather than once per product.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Count
+from rest_framework.renderers import JSONRenderer
+
+from shop import models
+from shop.serializers import ProductSerializer
+from shop.sparse import narrow_queryset
+
+CATALOG_VERSION_ID = 1
+SNAPSHOT_CACHE_KEY = 'shop:catalog:{version}:snapshot'
+CATEGORY_COUNTS_CACHE_KEY = 'shop:catalog:{version}:categories'
+# old versions are never read again, let them expire.
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+def get_catalog_version():
+    """Return the current catalog version."""
+    version = models.CatalogVersion.objects\
+        .filter(pk=CATALOG_VERSION_ID)\
+        .values_list('version', flat=True)\
+        .first()
+    return version or 0
+
+
+def bump_catalog_version():
+    """Move the catalog on to a new version."""
+    updated = models.CatalogVersion.objects\
+        .filter(pk=CATALOG_VERSION_ID)\
+        .update(version=F('version') + 1)
+    if not updated:
+        models.CatalogVersion.objects.get_or_create(
+            pk=CATALOG_VERSION_ID,
+            defaults={'version': 1})
+
+
+def render_catalog():
+    """Render every product in the catalog to JSON bytes."""
+    products = narrow_queryset(
+        models.Product.objects.order_by('id'),
+        ProductSerializer())
+    serializer = ProductSerializer(products, many=True)
+    return JSONRenderer().render(serializer.data)
+
+
+def get_catalog_snapshot(version):
+    """Return the rendered catalog JSON for ``version``."""
+    key = SNAPSHOT_CACHE_KEY.format(version=version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = render_catalog()
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def get_category_counts(version):
+    """Return the number of products in each category for ``version``."""
+    key = CATEGORY_COUNTS_CACHE_KEY.format(version=version)
+    counts = cache.get(key)
+    if counts is None:
+        counts = [
+            {'name': category['catagory'], 'count': category['count']}
+            for category in models.Product.objects
+            .values('catagory')
+            .annotate(count=Count('id'))
+            .order_by('catagory')
+        ]
+        cache.set(key, counts, SNAPSHOT_TIMEOUT)
+    return counts
+
+
+def delete_products(products):
+    """Delete ``products`` and their cart and order items in bulk."""
+    with transaction.atomic():
+        ids = list(products.values_list('id', flat=True))
+        if not ids:
+            return 0
+        # carts holding these products change once, not once per item.
+        models.Cart.objects\
+            .filter(user__cartitem__product_id__in=ids)\
+            .update(version=F('version') + 1)
+        models.Order.order.through.objects\
+            .filter(orderitem__product_id__in=ids).delete()
+        # nothing references these rows any more, so skip the
+        # collector and its per row signals.
+        for model in (models.CartItem, models.OrderItem):
+            items = model.objects.filter(product_id__in=ids)
+            items._raw_delete(items.db)
+        products = models.Product.objects.filter(id__in=ids)
+        products._raw_delete(products.db)
+        bump_catalog_version()
+    return len(ids)
+
+
+def reprice_products(products, price=None, percent=None):
+    """Set the price of ``products`` or change it by ``percent``."""
+    if price is None:
+        price = F('price') * (Decimal(100) + percent) / Decimal(100)
+    with transaction.atomic():
+        updated = products.update(price=price)
+        bump_catalog_version()
+    return updated
@@ -0,0 +1,80 @@
+"""
+Checkout of carts into orders
+"""
+from functools import partial
+
+from django.db import transaction
+
+from shop import models
+from shop.analytics import record_sales
+from shop.cart import LINE_TOTAL, bump_cart_version
+
+
+def place_order(user, email, delivery_info, lines, total_price,
+                details):
+    """Save the delivery info, order items and order, return the order.
+
+    ``lines`` are (product id, quantity) pairs, ``total_price`` their
+    total at the current prices and ``details`` the validated
+    CheckoutSerializer data. The items and their links to the order are
+    each written with one statement, whatever their number.
+    """
+    delivery_info_obj = delivery_info.save()
+    order_items = models.OrderItem.objects.bulk_create([
+        models.OrderItem(
+            user=user,
+            email=email,
+            product_id=product_id,
+            quantity=quantity)
+        for product_id, quantity in lines])
+    order = models.Order.objects.create(
+        user=user,
+        email=email,
+        personal_info_used=delivery_info_obj,
+        total_price=total_price,
+        **details)
+    models.Order.order.through.objects.bulk_create([
+        models.Order.order.through(order=order, orderitem=order_item)
+        for order_item in order_items])
+    # bulk_create skips m2m_changed, the order itself is rolled up by
+    # its post_save signal.
+    transaction.on_commit(partial(
+        record_sales,
+        order.date_ordered,
+        items_sold=sum(quantity for _, quantity in lines)))
+    return order
+
+
+def checkout_cart(user, email, delivery_info, details):
+    """Turn the user's cart into an order in one transaction.
+
+    The total is summed from the locked items at the current prices,
+    never taken from the client. Returns the order, or None without
+    writing anything if the cart is empty.
+    """
+    with transaction.atomic():
+        # items being checked out are locked until the order is placed,
+        # their products are only read for the line totals.
+        cart_items = list(models.CartItem.objects
+                          .select_for_update(of=('self',))
+                          .filter(user=user)
+                          .order_by('id')
+                          .annotate(line_total=LINE_TOTAL)
+                          .values_list('id', 'product_id', 'quantity',
+                                       'line_total'))
+        if not cart_items:
+            return None
+        order = place_order(
+            user,
+            email,
+            delivery_info,
+            [(product_id, quantity)
+             for _, product_id, quantity, _ in cart_items],
+            sum(line_total for _, _, _, line_total in cart_items),
+            details)
+        items = models.CartItem.objects.filter(
+            id__in=[item_id for item_id, _, _, _ in cart_items])
+        # the cart version is bumped once below, not per item.
+        items._raw_delete(items.db)
+        bump_cart_version(user.id)
+    return order
@@ -0,0 +1,21 @@
+"""
+Conditional GET helpers.
+
+Views build an ETag from cheap version counters and check it before
+doing any serialization, so a client that already has the current
+representation gets a bodyless 304.
+"""
+from django.utils.cache import get_conditional_response, quote_etag
+
+
+def make_etag(*parts):
+    """Create and return a quoted ETag from version parts."""
+    return quote_etag('-'.join(str(part) for part in parts))
+
+
+def not_modified(request, etag):
+    """Return a 304 response if the client already has ``etag``."""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
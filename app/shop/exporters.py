@@ -0,0 +1,88 @@
+"""
+Streaming order export to JSONL or CSV.
+
+Orders are read with a server-side cursor a chunk at a time, their
+items and products prefetched per chunk, and each line is yielded as
+soon as it is built, so memory stays flat however many orders there
+are and the first bytes reach the client straight away.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from shop import models
+
+FORMATS = ['jsonl', 'csv']
+CHUNK_SIZE = 2000
+CONTENT_TYPES = {'jsonl': 'application/jsonl', 'csv': 'text/csv'}
+CSV_HEADER = ['order_id', 'date_ordered', 'user', 'email', 'delivery_status',
+              'total_price', 'order_item_id', 'product', 'product_name',
+              'price', 'quantity']
+
+
+class Echo:
+    """File-like object that returns what is written to it"""
+
+    def write(self, value):
+        return value
+
+
+def get_export_queryset(orders):
+    """Return ``orders`` with the items and products they export."""
+    return orders\
+        .only('id', 'date_ordered', 'user', 'email', 'delivery_status',
+              'total_price')\
+        .prefetch_related(Prefetch(
+            'order',
+            queryset=models.OrderItem.objects
+            .select_related('product')
+            .only('id', 'quantity', 'product__name', 'product__price')
+            .order_by('id')))\
+        .order_by('id')
+
+
+def order_to_dict(order):
+    """Return an order and its items as a JSON-able dict."""
+    return {
+        'id': order.id,
+        'date_ordered': order.date_ordered,
+        'user': order.user_id,
+        'email': order.email,
+        'delivery_status': order.delivery_status,
+        'total_price': order.total_price,
+        'items': [{
+            'id': item.id,
+            'product': item.product_id,
+            'product_name': item.product.name,
+            'price': item.product.price,
+            'quantity': item.quantity,
+        } for item in order.order.all()],
+    }
+
+
+def order_to_rows(order):
+    """Return the CSV rows of an order, one per item."""
+    order = order_to_dict(order)
+    columns = [order['id'], order['date_ordered'], order['user'],
+               order['email'], order['delivery_status'],
+               order['total_price']]
+    if not order['items']:
+        return [columns + [''] * 5]
+    return [columns + [item['id'], item['product'], item['product_name'],
+                       item['price'], item['quantity']]
+            for item in order['items']]
+
+
+def export_orders(orders, format='jsonl', chunk_size=CHUNK_SIZE):
+    """Yield ``orders`` as lines of JSONL or CSV."""
+    orders = get_export_queryset(orders).iterator(chunk_size=chunk_size)
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(CSV_HEADER)
+        for order in orders:
+            yield ''.join(writer.writerow(row) for row in order_to_rows(order))
+        return
+    for order in orders:
+        yield json.dumps(order_to_dict(order), cls=DjangoJSONEncoder) + '\n'
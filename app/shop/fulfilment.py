@@ -0,0 +1,35 @@
+"""
+Delivery status changes for batches of orders
+"""
+from django.db import connection
+
+PROCESSING = 'Processing Order'
+DISPATCHED = 'Dispatched'
+DELIVERED = 'Delivered'
+
+# only orders still in the expected status are moved, so two clerks
+# working on the same orders can't undo each other's changes.
+TRANSITION_ORDERS_SQL = """
+UPDATE shop_order
+SET delivery_status = %(to_status)s
+WHERE id = ANY(%(ids)s) AND delivery_status = %(from_status)s
+RETURNING id
+"""
+
+
+def transition_orders(ids, from_status, to_status):
+    """Move the orders in ``from_status`` to ``to_status``.
+
+    Returns the ids that were moved and the ids that were skipped
+    because they don't exist or are in another status.
+    """
+    ids = sorted(set(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(TRANSITION_ORDERS_SQL, {
+            'ids': ids,
+            'from_status': from_status,
+            'to_status': to_status,
+        })
+        updated = sorted(row[0] for row in cursor.fetchall())
+    skipped = sorted(set(ids) - set(updated))
+    return updated, skipped
@@ -0,0 +1,112 @@
+"""
+Idempotency keys for the checkout endpoints.
+
+A client that retries a checkout sends the same ``Idempotency-Key``
+header, the first successful response is stored against the key and
+replayed to every retry without running the checkout again. The key is
+claimed with an insert on a unique index, so a concurrent duplicate
+blocks on that index until the first request commits or rolls back.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import status
+from rest_framework.response import Response
+
+from shop import models
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# stored responses are purged by the purge_idempotency_keys command.
+KEY_TTL = timedelta(hours=24)
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    HEADER,
+    str,
+    location=OpenApiParameter.HEADER,
+    description='Retries with the same key replay the first response.')
+
+# returns a row only when this request is the first to use the key.
+CLAIM_KEY_SQL = """
+INSERT INTO shop_idempotencykey (key, path, user_id, request_hash, created)
+VALUES (%(key)s, %(path)s, %(user_id)s, %(request_hash)s, %(created)s)
+ON CONFLICT (path, key) DO NOTHING
+RETURNING id
+"""
+
+
+def hash_request(request):
+    """Return a fingerprint of the request body."""
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def claim_key(key, path, user_id, request_hash):
+    """Claim a key and return its id, None if it was already used."""
+    with connection.cursor() as cursor:
+        cursor.execute(CLAIM_KEY_SQL, {
+            'key': key,
+            'path': path,
+            'user_id': user_id,
+            'request_hash': request_hash,
+            'created': timezone.now(),
+        })
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def replay(key, path, user_id, request_hash):
+    """Return the stored response for a key that was already used."""
+    record = models.IdempotencyKey.objects.get(path=path, key=key)
+    if record.request_hash != request_hash or record.user_id != user_id:
+        return Response(
+            {"Message": f"{HEADER} was already used for another request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(
+        record.response,
+        status=record.status_code,
+        headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view):
+    """Make a view replay its response to retries with the same key."""
+    @functools.wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(self, request, *args, **kwargs)
+        if not 0 < len(key) <= MAX_KEY_LENGTH:
+            return Response(
+                {"Message": f"{HEADER} must be 1 to "
+                            f"{MAX_KEY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST)
+        user_id = request.user.id
+        request_hash = hash_request(request)
+        with transaction.atomic():
+            key_id = claim_key(key, request.path, user_id, request_hash)
+            if key_id is not None:
+                response = view(self, request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    models.IdempotencyKey.objects.filter(id=key_id).update(
+                        status_code=response.status_code,
+                        response=response.data)
+                else:
+                    # failures aren't kept so a fixed request can reuse
+                    # the key, they wrote nothing else to undo.
+                    transaction.set_rollback(True)
+                return response
+        return replay(key, request.path, user_id, request_hash)
+    return wrapper
+
+
+def purge_idempotency_keys(older_than=KEY_TTL):
+    """Delete the keys stored before ``older_than`` and return the count."""
+    keys = models.IdempotencyKey.objects.filter(
+        created__lt=timezone.now() - older_than)
+    return keys._raw_delete(keys.db)
@@ -0,0 +1,146 @@
+"""
+Bulk product import from JSONL or CSV.
+
+Rows are read lazily, validated with the ProductSerializer and written
+with one upserting bulk_create per batch, so memory stays flat however
+large the input is. Rows that fail validation are reported and skipped
+without aborting the rest of their batch. A file that can't be read any
+further, e.g. invalid UTF-8 or broken CSV quoting, stops the import
+after saving the rows read before it.
+"""
+import csv
+import json
+
+from django.core.management.color import no_style
+from django.db import connection, transaction, DatabaseError
+
+from shop import models
+from shop.catalog import bump_catalog_version
+from shop.serializers import ProductSerializer
+
+FORMATS = ['jsonl', 'csv']
+BATCH_SIZE = 500
+# keep the report bounded for very dirty files.
+MAX_REPORTED_ERRORS = 1000
+UPDATE_FIELDS = ['name', 'image_url', 'price', 'description_short',
+                 'description_long', 'catagory']
+
+
+def guess_format(filename):
+    """Return the import format for a file name."""
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(lines, format):
+    """Yield the line number and row of each product in ``lines``."""
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError:
+            yield line_num, line
+
+
+def build_product(row):
+    """Validate a row and return an unsaved product or the errors."""
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ['Row is not a JSON object.']}
+    row = dict(row)
+    # rows with an id update that product, the rest are created.
+    product_id = row.pop('id', None) or None
+    errors = {}
+    if product_id is not None:
+        try:
+            product_id = int(product_id)
+            if product_id < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors['id'] = ['A valid integer is required.']
+    serializer = ProductSerializer(data=row)
+    if not serializer.is_valid():
+        errors.update(serializer.errors)
+    if errors:
+        return None, errors
+    return models.Product(id=product_id, **serializer.validated_data), None
+
+
+def save_batch(products):
+    """Upsert a batch of products in one statement."""
+    with transaction.atomic():
+        models.Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=UPDATE_FIELDS,
+            )
+        # committed with the batch, so an import that stops later
+        # never leaves the sequence behind the imported ids.
+        if any(product.id is not None for product in products):
+            reset_product_sequence()
+        # bulk_create skips the signals, bump once for the whole batch.
+        bump_catalog_version()
+
+
+def reset_product_sequence():
+    """Move the product id sequence past explicitly imported ids."""
+    sequence_sql = connection.ops.sequence_reset_sql(
+        no_style(), [models.Product])
+    with connection.cursor() as cursor:
+        for sql in sequence_sql:
+            cursor.execute(sql)
+
+
+def import_products(lines, format='jsonl', batch_size=BATCH_SIZE):
+    """Import the products in ``lines`` and return a report.
+
+    ``aborted`` is set in the report when the file stopped being
+    readable part way through.
+    """
+    report = {'imported': 0, 'failed': 0, 'aborted': False, 'errors': []}
+
+    def add_error(line_num, errors):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_num, 'errors': errors})
+
+    def flush(batch):
+        # a later row for the same id wins, postgres can't
+        # upsert one row twice in a statement.
+        products = {}
+        for line_num, product in batch:
+            products[product.id or ('new', line_num)] = (line_num, product)
+        try:
+            save_batch([product for _, product in products.values()])
+        except DatabaseError as error:
+            for line_num, _ in products.values():
+                add_error(line_num, {'non_field_errors': [str(error)]})
+            return
+        report['imported'] += len(products)
+
+    batch = []
+    line_num = 0
+    try:
+        for line_num, row in read_rows(lines, format):
+            product, errors = build_product(row)
+            if errors:
+                add_error(line_num, errors)
+                continue
+            batch.append((line_num, product))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as error:
+        report['aborted'] = True
+        report['errors'].append({
+            'line': line_num + 1,
+            'errors': {'non_field_errors': [f'Unreadable file: {error}']},
+        })
+    if batch:
+        flush(batch)
+    return report
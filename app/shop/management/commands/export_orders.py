@@ -0,0 +1,52 @@
+"""
+Django command to export orders to a JSONL or CSV file.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import models
+from shop.exporters import FORMATS, CHUNK_SIZE, export_orders
+from shop.serializers import OrderSearchSerializer
+
+
+class Command(BaseCommand):
+    """Django command to export orders."""
+    help = 'Export orders with their items as JSONL or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='File to write, stdout by default.')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default='jsonl',
+            help='Output format.')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Number of orders read from the database at a time.')
+        parser.add_argument('--delivery-status')
+        parser.add_argument('--date-from', help='YYYY-MM-DD')
+        parser.add_argument('--date-to', help='YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        filters = OrderSearchSerializer(data={
+            name: options[name]
+            for name in ('delivery_status', 'date_from', 'date_to')
+            if options[name] is not None})
+        if not filters.is_valid():
+            raise CommandError(filters.errors)
+        lines = export_orders(
+            filters.filter_orders(models.Order.objects.all()),
+            format=options['format'],
+            chunk_size=options['chunk_size'])
+        if options['output'] is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', newline='') as file:
+            file.writelines(lines)
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported orders to {options['output']}."))
@@ -0,0 +1,52 @@
+"""
+Django command to bulk import products from a JSONL or CSV file.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.importers import (
+    FORMATS,
+    BATCH_SIZE,
+    guess_format,
+    import_products,
+)
+
+
+class Command(BaseCommand):
+    """Django command to bulk import products."""
+    help = 'Import products from a JSONL or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL or CSV file of products.')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Input format, guessed from the file name by default.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of products written per statement.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        path = options['path']
+        format = options['format'] or guess_format(path)
+        self.stdout.write(f'Importing products from {path}...')
+        with open(path, newline='', encoding='utf-8-sig') as lines:
+            report = import_products(
+                lines,
+                format=format,
+                batch_size=options['batch_size'])
+
+        for error in report['errors']:
+            self.stderr.write(
+                f"Line {error['line']}: {json.dumps(error['errors'])}")
+        if report['aborted']:
+            raise CommandError(
+                f"Stopped at an unreadable line after importing "
+                f"{report['imported']} products.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['imported']} products, "
+            f"{report['failed']} failed."))
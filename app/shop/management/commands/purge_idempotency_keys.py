@@ -0,0 +1,26 @@
+"""
+Django command to delete expired checkout idempotency keys.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from shop.idempotency import KEY_TTL, purge_idempotency_keys
+
+
+class Command(BaseCommand):
+    """Django command to purge idempotency keys."""
+    help = 'Delete idempotency keys older than the given number of hours.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=int(KEY_TTL.total_seconds() // 3600),
+            help='Age in hours after which keys are deleted.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        deleted = purge_idempotency_keys(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} idempotency keys.'))
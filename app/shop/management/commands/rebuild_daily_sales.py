@@ -0,0 +1,29 @@
+"""
+Django command to rebuild the daily sales rollup from the orders.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from shop.analytics import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    """Django command to rebuild daily sales."""
+    help = 'Recompute the daily sales rollup, for all days by default.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date-from',
+            type=date.fromisoformat,
+            help='First day to rebuild, YYYY-MM-DD.')
+        parser.add_argument(
+            '--date-to',
+            type=date.fromisoformat,
+            help='Last day to rebuild, YYYY-MM-DD.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        days = rebuild_daily_sales(options['date_from'], options['date_to'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt daily sales for {days} days.'))
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0029_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='catagory',
+            field=models.CharField(db_index=True, default='Ring', max_length=255),
+        ),
+    ]
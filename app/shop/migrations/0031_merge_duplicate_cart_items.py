@@ -0,0 +1,34 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:46
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    CartItem = apps.get_model('shop', 'CartItem')
+    duplicates = CartItem.objects\
+        .values('user', 'product')\
+        .annotate(count=Count('id'), keep=Min('id'), total=Sum('quantity'))\
+        .filter(count__gt=1)
+    for duplicate in duplicates:
+        CartItem.objects\
+            .filter(pk=duplicate['keep'])\
+            .update(quantity=duplicate['total'])
+        CartItem.objects\
+            .filter(user=duplicate['user'], product=duplicate['product'])\
+            .exclude(pk=duplicate['keep'])\
+            .delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0030_alter_product_catagory'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_cart_items,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 08:49
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0032_cartitem_user_product_unique'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='cart',
+            name='products',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0035_order_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='token',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:01
+
+import secrets
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def populate_order_tokens(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    orders = Order.objects.filter(token__isnull=True).only('id')
+    batch = []
+    for order in orders.iterator(chunk_size=BATCH_SIZE):
+        order.token = secrets.token_urlsafe(32)
+        batch.append(order)
+        if len(batch) >= BATCH_SIZE:
+            Order.objects.bulk_update(batch, ['token'])
+            batch = []
+    Order.objects.bulk_update(batch, ['token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0036_order_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            populate_order_tokens,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:01
+
+from django.db import migrations, models
+import shop.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0037_populate_order_token'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='token',
+            field=models.CharField(default=shop.models.make_order_token, editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['email', 'token'], name='shop_order_email_token_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+# rolls up the orders placed before the rollup existed.
+BACKFILL_DAILY_SALES_SQL = """
+INSERT INTO shop_dailysales (date, order_count, revenue, items_sold)
+SELECT orders.date_ordered, COUNT(*), SUM(orders.total_price),
+       COALESCE(SUM(items.quantity), 0)
+FROM shop_order orders
+LEFT JOIN (
+    SELECT link.order_id, SUM(item.quantity) AS quantity
+    FROM shop_order_order link
+    JOIN shop_orderitem item ON item.id = link.orderitem_id
+    GROUP BY link.order_id
+) items ON items.order_id = orders.id
+GROUP BY orders.date_ordered
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0038_alter_order_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('items_sold', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(
+            BACKFILL_DAILY_SALES_SQL,
+            migrations.RunSQL.noop,
+        ),
+    ]
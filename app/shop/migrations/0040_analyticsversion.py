@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-18 09:07
+
+from django.db import migrations, models
+
+
+def create_analytics_version(apps, schema_editor):
+    AnalyticsVersion = apps.get_model('shop', 'AnalyticsVersion')
+    AnalyticsVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0039_dailysales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(
+            create_analytics_version,
+            migrations.RunPython.noop,
+        ),
+    ]
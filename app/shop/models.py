@@ -1,8 +1,13 @@
 """
 Models for the shop
 """
+import secrets
+
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 """
 keep the below in mind as the product model relies on the id
 to generate the card1 and card2 id.
@@ -17,13 +22,41 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=5, decimal_places=2)
     description_short = models.TextField()
     description_long = models.TextField()
-    catagory = models.CharField(max_length=255, default="Ring")
+    catagory = models.CharField(max_length=255, default="Ring", db_index=True)
+    # maintained by a database trigger, see migration 0029.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                fields=['search_vector'],
+                name='shop_product_search_idx'
+                ),
+        ]
 
     def __str__(self):
         """Return the model as a string"""
         return self.name
 
 
+class CatalogVersion(models.Model):
+    """Version of the product catalog, bumped on every product write"""
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        """Return the model as a string"""
+        return f'catalog version {self.version}'
+
+
+class AnalyticsVersion(models.Model):
+    """Version of the order history, bumped on every order write"""
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        """Return the model as a string"""
+        return f'analytics version {self.version}'
+
+
 class CartItem(models.Model):
     """Individual product with quantity in Cart"""
     user = models.ForeignKey(
@@ -37,20 +70,27 @@ class CartItem(models.Model):
     quantity = models.IntegerField(
     )
 
+    class Meta:
+        constraints = [
+            # adding a product already in the cart bumps its quantity.
+            models.UniqueConstraint(
+                fields=['user', 'product'],
+                name='shop_cartitem_user_product_unique'
+                ),
+        ]
+
     def __str__(self):
         """Return the model as a string"""
         return f'{self.user} wants {self.product} {self.quantity} times'
 
 
 class Cart(models.Model):
-    """Cart for each user"""
+    """Cart for each user, its items are the user's CartItems"""
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE)
-    products = models.ManyToManyField(
-        CartItem,
-        blank=True,
-    )
+    # bumped whenever the user's cart items change.
+    version = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         """Return the model as a string"""
@@ -108,6 +148,11 @@ class UserDeliveryInfo(models.Model):
             User Delivery Info'
 
 
+def make_order_token():
+    """Create and return an unguessable order tracking token."""
+    return secrets.token_urlsafe(32)
+
+
 class Order(models.Model):
     """Orders for each user/anonymous user"""
     # for future referance user and email are both optional
@@ -143,7 +188,34 @@ class Order(models.Model):
     date_ordered = models.DateField(
         auto_now_add=True
         )
-    total_price = models.DecimalField(max_digits=5, decimal_places=2)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    # lets anonymous customers look their order up with their email.
+    token = models.CharField(
+        max_length=64,
+        default=make_order_token,
+        editable=False
+        )
+
+    class Meta:
+        # staff search pages through orders by (date_ordered, id),
+        # optionally narrowed by one of the filtered columns.
+        indexes = [
+            models.Index(
+                fields=['date_ordered', 'id'],
+                name='shop_order_date_id_idx'),
+            models.Index(
+                fields=['delivery_status', 'date_ordered', 'id'],
+                name='shop_order_status_date_id_idx'),
+            models.Index(
+                fields=['email', 'date_ordered', 'id'],
+                name='shop_order_email_date_id_idx'),
+            models.Index(
+                fields=['user', 'date_ordered', 'id'],
+                name='shop_order_user_date_id_idx'),
+            models.Index(
+                fields=['email', 'token'],
+                name='shop_order_email_token_idx'),
+        ]
 
     def __str__(self):
         """Return the model as a string"""
@@ -186,3 +258,43 @@ class DefaultUserDeliveryInfo(models.Model):
     def __str__(self):
         """Return the model as a string"""
         return f'{self.user}\'s default User Delivery Info'
+
+
+class DailySales(models.Model):
+    """Orders, revenue and items sold per day, kept up to date on order"""
+    date = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        """Return the model as a string"""
+        return f'{self.order_count} orders on {self.date}'
+
+
+class IdempotencyKey(models.Model):
+    """Response stored for a request sent with an Idempotency-Key"""
+    key = models.CharField(max_length=255)
+    path = models.CharField(max_length=255)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True
+        )
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['path', 'key'],
+                name='shop_idempotencykey_path_key_unique'),
+        ]
+
+    def __str__(self):
+        """Return the model as a string"""
+        return f'{self.key} for {self.path}'
@@ -0,0 +1,109 @@
+"""
+Pagination for the shop API
+"""
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+
+from django.db.models import F, Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProductCursorPagination(pagination.CursorPagination):
+    """Keyset pagination over the product catalog ordered by id"""
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 500
+
+    def is_requested(self, request):
+        """Only paginate when the client asks for it."""
+        params = request.query_params
+        return (self.cursor_query_param in params
+                or self.page_size_query_param in params)
+
+
+class OrderKeysetPagination(pagination.BasePagination):
+    """Keyset pagination over orders, newest first by (date_ordered, id)
+
+    The cursor holds the date and id of the last order on the page, so
+    every page is an index range scan however deep into the orders it is.
+    """
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        """Return the requested page size, capped at the maximum."""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, order):
+        """Return the cursor pointing after ``order``."""
+        position = f'{order.cursor_date.isoformat()}|{order.pk}'
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        """Return the (date_ordered, id) of the cursor, if any."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = urlsafe_b64decode(encoded.encode()).decode()
+            date_ordered, pk = position.split('|')
+            return date.fromisoformat(date_ordered), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        self.request = request
+        position = self.decode_cursor(request)
+        if position is not None:
+            date_ordered, pk = position
+            # the first condition bounds the index range, the second
+            # skips the orders of that date already seen.
+            queryset = queryset.filter(
+                Q(date_ordered__lte=date_ordered),
+                Q(date_ordered__lt=date_ordered) | Q(id__lt=pk))
+        # annotated so the cursor is read even when the field is trimmed.
+        queryset = queryset\
+            .annotate(cursor_date=F('date_ordered'))\
+            .order_by('-date_ordered', '-id')
+        results = list(queryset[:page_size + 1])
+        self.next_order = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_order = results[-1]
+        return results
+
+    def get_next_link(self):
+        """Return the link to the next page, None on the last page."""
+        if self.next_order is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_order))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
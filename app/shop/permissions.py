@@ -29,8 +29,8 @@ class UpdateOwnOrder(permissions.BasePermission):
             if request.user.is_staff:
                 return True
             else:
-                return obj.user == request.user
+                return obj.user_id == request.user.id
         if request.user.is_staff:
             return True
         else:
-            return obj.user == request.user
+            return obj.user_id == request.user.id
@@ -1,9 +1,20 @@
 """
 Serializers for the shop API View.
 """
+from django.utils import timezone
 from rest_framework import serializers
 
 from shop import models
+from shop.analytics import (
+    GRANULARITIES,
+    GRANULARITY_DAYS,
+    MAX_BUCKETS,
+    RANKINGS,
+)
+from shop.sparse import SparseFieldsMixin
+
+# most units of one product a single cart or order line request takes.
+MAX_QUANTITY = 1000
 
 
 class UserDeliveryInfoSerializer(serializers.ModelSerializer):
@@ -22,7 +33,7 @@ class DefaultUserDeliveryInfoSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'default_info']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializes Product Model"""
     class Meta:
         model = models.Product
@@ -30,6 +41,48 @@ class ProductSerializer(serializers.ModelSerializer):
                   'description_short', 'description_long', 'catagory']
 
 
+class ProductSelectionSerializer(serializers.Serializer):
+    """Serializes a selection of products for bulk changes"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False)
+    catagory = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        """Check products are selected by ids or catagory."""
+        if 'ids' not in attrs and 'catagory' not in attrs:
+            raise serializers.ValidationError(
+                'Select products by ids or catagory.')
+        return attrs
+
+    def get_products(self):
+        """Return the selected products."""
+        products = models.Product.objects.all()
+        if 'ids' in self.validated_data:
+            products = products.filter(id__in=self.validated_data['ids'])
+        if 'catagory' in self.validated_data:
+            products = products.filter(
+                catagory=self.validated_data['catagory'])
+        return products
+
+
+class ProductPriceSerializer(ProductSelectionSerializer):
+    """Serializes a bulk price change for a selection of products"""
+    price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, required=False)
+    percent = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=-100, required=False)
+
+    def validate(self, attrs):
+        """Check exactly one of price or percent is given."""
+        attrs = super().validate(attrs)
+        if ('price' in attrs) == ('percent' in attrs):
+            raise serializers.ValidationError(
+                'Give either a price or a percent.')
+        return attrs
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     """Serializes the Cart Item Model"""
     class Meta:
@@ -37,11 +90,63 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'product', 'quantity']
 
 
+class CartItemAddSerializer(serializers.Serializer):
+    """Serializes a product being added to the cart"""
+    user = serializers.IntegerField()
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(
+        min_value=1, max_value=MAX_QUANTITY)
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """Serializes one add, set or remove operation on the cart"""
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(
+        min_value=0, max_value=MAX_QUANTITY, required=False)
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+
+    def validate(self, attrs):
+        """Check add and set operations have a quantity."""
+        if attrs['op'] != 'remove' and 'quantity' not in attrs:
+            raise serializers.ValidationError(
+                {'quantity': 'This field is required.'})
+        if attrs['op'] == 'add' and attrs['quantity'] < 1:
+            raise serializers.ValidationError(
+                {'quantity': 'Ensure this value is greater than 0.'})
+        return attrs
+
+
+class CartItemReadSerializer(SparseFieldsMixin,
+                             serializers.ModelSerializer):
+    """Serializes the Cart Item Model with its product to read only"""
+    cart_item_id = serializers.IntegerField(source='id', read_only=True)
+    product = ProductSerializer(read_only=True)
+    # annotated by the query, see shop.cart.LINE_TOTAL.
+    line_total = serializers.DecimalField(
+        max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = models.CartItem
+        fields = ['cart_item_id', 'product', 'quantity', 'line_total']
+
+
+class CartTotalsSerializer(serializers.Serializer):
+    """Serializes the totals of a cart"""
+    item_count = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
 class CartSerializer(serializers.ModelSerializer):
     """Serializes Cart Model"""
     class Meta:
         model = models.Cart
-        fields = ['id', 'user', 'products']
+        fields = ['id', 'user']
+
+
+class CartReadSerializer(CartTotalsSerializer):
+    """Serializes the user's cart with its items to read only"""
+    id = serializers.IntegerField()
+    items = CartItemReadSerializer(many=True)
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -60,6 +165,32 @@ class OrderSerializer(serializers.ModelSerializer):
                   'delivery_status', 'date_ordered', 'total_price']
 
 
+class CheckoutSerializer(serializers.ModelSerializer):
+    """Serializes the order details sent at checkout
+
+    The total price is computed from the products ordered, a total sent
+    by older clients is ignored.
+    """
+    delivery_msg = serializers.CharField(
+        source='delivery_instructions', allow_blank=True)
+
+    class Meta:
+        model = models.Order
+        fields = ['delivery_msg']
+
+
+class AnonymousOrderItemSerializer(serializers.Serializer):
+    """Serializes one product of an anonymous order"""
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(
+        min_value=1, max_value=MAX_QUANTITY)
+
+
+class AnonymousCartSerializer(serializers.Serializer):
+    """Serializes the products of an anonymous order"""
+    products = AnonymousOrderItemSerializer(many=True, allow_empty=False)
+
+
 class OrderItemReadSerializer(serializers.ModelSerializer):
     """Serializes Order Model"""
     product = ProductSerializer()
@@ -69,7 +200,7 @@ class OrderItemReadSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'email', 'product', 'quantity', 'date_ordered']
 
 
-class OrderReadSerializer(serializers.ModelSerializer):
+class OrderReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializes Order Model to read only"""
     order = OrderItemReadSerializer(many=True)
     personal_info_used = UserDeliveryInfoSerializer()
@@ -81,6 +212,133 @@ class OrderReadSerializer(serializers.ModelSerializer):
                   'delivery_status', 'date_ordered', 'total_price']
 
 
+class OrderSearchSerializer(serializers.Serializer):
+    """Serializes the filters of the staff order search"""
+    delivery_status = serializers.CharField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    email = serializers.EmailField(required=False)
+    user = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        """Check the date range isn't reversed."""
+        if attrs.get('date_from') and attrs.get('date_to') and \
+                attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError(
+                'date_from must not be after date_to.')
+        return attrs
+
+    def filter_orders(self, orders):
+        """Return the orders matching the filters."""
+        filters = self.validated_data
+        if 'delivery_status' in filters:
+            orders = orders.filter(delivery_status=filters['delivery_status'])
+        if 'date_from' in filters:
+            orders = orders.filter(date_ordered__gte=filters['date_from'])
+        if 'date_to' in filters:
+            orders = orders.filter(date_ordered__lte=filters['date_to'])
+        if 'email' in filters:
+            orders = orders.filter(email=filters['email'])
+        if 'user' in filters:
+            orders = orders.filter(user=filters['user'])
+        return orders
+
+
+class OrderStatusSerializer(serializers.Serializer):
+    """Serializes a delivery status change for many orders"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False)
+    from_status = serializers.CharField(max_length=255)
+    to_status = serializers.CharField(max_length=255)
+
+
+class OrderTrackSerializer(serializers.Serializer):
+    """Serializes the email and token an anonymous order is found by"""
+    email = serializers.EmailField()
+    token = serializers.CharField(max_length=64)
+
+
+class DateRangeSerializer(serializers.Serializer):
+    """Serializes an optional from/to range of days"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # from is a python keyword so it can't be declared as an attribute.
+        fields['from'] = serializers.DateField(
+            source='date_from', required=False)
+        fields['to'] = serializers.DateField(
+            source='date_to', required=False)
+        return fields
+
+    def validate(self, attrs):
+        """Check the date range isn't reversed."""
+        if attrs.get('date_from') and attrs.get('date_to') and \
+                attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError('from must not be after to.')
+        return attrs
+
+
+class SalesSeriesSerializer(DateRangeSerializer):
+    """Serializes the range and granularity of a sales series"""
+    granularity = serializers.ChoiceField(
+        choices=GRANULARITIES, default='day')
+
+    def validate(self, attrs):
+        """Check the range up to to or today fits in MAX_BUCKETS years."""
+        attrs = super().validate(attrs)
+        if attrs.get('date_from'):
+            date_to = attrs.get('date_to') or timezone.localdate()
+            if attrs['date_from'] > date_to:
+                raise serializers.ValidationError(
+                    'from must not be after to.')
+            days = (date_to - attrs['date_from']).days + 1
+            if days > MAX_BUCKETS * GRANULARITY_DAYS['year']:
+                raise serializers.ValidationError(
+                    f'from and to must be at most {MAX_BUCKETS} years apart.')
+        return attrs
+
+
+class SalesPeriodSerializer(serializers.Serializer):
+    """Serializes the sales of one period"""
+    period = serializers.DateField()
+    orders = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class SalesSeriesReadSerializer(serializers.Serializer):
+    """Serializes a sales time series to read only"""
+    granularity = serializers.CharField()
+    source = serializers.CharField()
+    series = SalesPeriodSerializer(many=True)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fields['from'] = serializers.DateField()
+        fields['to'] = serializers.DateField()
+        return fields
+
+
+class PopularitySerializer(DateRangeSerializer):
+    """Serializes how many products to rank and by what"""
+    n = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    by = serializers.ChoiceField(choices=RANKINGS, default='units')
+
+
+class ProductPopularitySerializer(serializers.Serializer):
+    """Serializes a product with its sales to read only"""
+    product = ProductSerializer(source='*')
+    units = serializers.IntegerField()
+    orders = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class PopularityReadSerializer(serializers.Serializer):
+    """Serializes the most and least popular products to read only"""
+    top = ProductPopularitySerializer(many=True)
+    bottom = ProductPopularitySerializer(many=True)
+
+
 class OrderListSerializer(serializers.ModelSerializer):
     """Serializes OrderList Model"""
     class Meta:
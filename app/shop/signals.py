@@ -0,0 +1,69 @@
+"""
+Signal receivers for the shop
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from shop import models
+from shop.catalog import bump_catalog_version
+from shop.cart import bump_cart_version
+from shop.analytics import bump_analytics_version, record_sales
+
+
+@receiver(post_save, sender=models.Product)
+@receiver(post_delete, sender=models.Product)
+def product_changed(sender, **kwargs):
+    """Invalidate the catalog snapshot when a product is written."""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=models.CartItem)
+@receiver(post_delete, sender=models.CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    """Invalidate the owner's cart when one of its items is written."""
+    bump_cart_version(instance.user_id)
+
+
+@receiver(post_save, sender=models.Order)
+@receiver(post_delete, sender=models.Order)
+def order_changed(sender, created=False, **kwargs):
+    """Invalidate the cached analytics when an order is written."""
+    # new orders are invalidated by record_sales once rolled up.
+    if not created:
+        # after commit, so checkouts don't queue on the version row.
+        transaction.on_commit(bump_analytics_version)
+
+
+@receiver(m2m_changed, sender=models.Order.order.through)
+def order_items_changed(sender, action, reverse, pk_set, **kwargs):
+    """Invalidate the cached analytics when an order's items change."""
+    rolled_up = action == 'post_add' and not reverse and pk_set
+    if action.startswith('post_') and not rolled_up:
+        transaction.on_commit(bump_analytics_version)
+
+
+@receiver(post_save, sender=models.Order)
+def order_saved(sender, instance, created, **kwargs):
+    """Roll a new order up into the sales of its day."""
+    if created:
+        transaction.on_commit(partial(
+            record_sales,
+            instance.date_ordered,
+            order_count=1,
+            revenue=instance.total_price))
+
+
+@receiver(m2m_changed, sender=models.Order.order.through)
+def order_items_added(sender, instance, action, reverse, pk_set, **kwargs):
+    """Roll the items added to an order up into the sales of its day."""
+    if action != 'post_add' or reverse or not pk_set:
+        return
+    items_sold = models.OrderItem.objects\
+        .filter(pk__in=pk_set)\
+        .aggregate(total=Sum('quantity'))['total']
+    transaction.on_commit(partial(
+        record_sales, instance.date_ordered, items_sold=items_sold or 0))
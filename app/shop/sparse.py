@@ -0,0 +1,101 @@
+"""
+Sparse fieldsets for the shop API.
+
+Clients pass ``?fields=`` to keep only some fields or ``?omit=`` to
+drop some, as comma separated names. Nested serializers are addressed
+with dotted names, e.g. ``?omit=order.product.description_long``.
+The trimmed serializer is also used to narrow the SQL so that columns
+which are thrown away are never fetched.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def get_sparse_fields(request):
+    """Return the fields/omit serializer kwargs requested by the client."""
+    sparse = {}
+    for param in ('fields', 'omit'):
+        value = request.query_params.get(param)
+        if value:
+            sparse[param] = [
+                name.strip() for name in value.split(',') if name.strip()]
+    return sparse
+
+
+def _nested_names(names, field_name):
+    """Return the names addressed to the nested field ``field_name``."""
+    prefix = f'{field_name}.'
+    return [name[len(prefix):] for name in names if name.startswith(prefix)]
+
+
+def trim_fields(serializer, fields=None, omit=None):
+    """Remove the fields not asked for from ``serializer``."""
+    if fields is not None:
+        keep = {name.split('.', 1)[0] for name in fields}
+        for name in set(serializer.fields) - keep:
+            serializer.fields.pop(name)
+    for name in omit or []:
+        if '.' not in name:
+            serializer.fields.pop(name, None)
+    for name, field in serializer.fields.items():
+        nested = getattr(field, 'child', field)
+        if not isinstance(nested, serializers.Serializer):
+            continue
+        nested_fields = _nested_names(fields or [], name)
+        trim_fields(
+            nested,
+            nested_fields or None,
+            _nested_names(omit or [], name))
+
+
+class SparseFieldsMixin:
+    """Serializer that accepts ``fields`` and ``omit`` keyword arguments"""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        omit = kwargs.pop('omit', None)
+        super().__init__(*args, **kwargs)
+        trim_fields(self, fields, omit)
+
+
+def _loaded_fields(serializer, prefix=''):
+    """Return the only/select_related/prefetch lookups of a serializer."""
+    model = serializer.Meta.model
+    only, related, prefetches = [], [], []
+    for field in serializer.fields.values():
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        nested = getattr(field, 'child', field)
+        if not isinstance(nested, serializers.ModelSerializer):
+            nested = None
+        lookup = prefix + model_field.name
+        if model_field.many_to_many:
+            related_model = model_field.related_model
+            queryset = related_model.objects.only('pk')
+            if nested is not None:
+                queryset = narrow_queryset(
+                    related_model.objects.all(), nested)
+            prefetches.append(Prefetch(lookup, queryset=queryset))
+        elif model_field.concrete:
+            only.append(lookup)
+            if model_field.is_relation and nested is not None:
+                related.append(lookup)
+                nested_lookups = _loaded_fields(nested, f'{lookup}__')
+                only += nested_lookups[0]
+                related += nested_lookups[1]
+                prefetches += nested_lookups[2]
+    return only, related, prefetches
+
+
+def narrow_queryset(queryset, serializer):
+    """Load only what ``serializer`` emits, joining nested relations."""
+    serializer = getattr(serializer, 'child', serializer)
+    only, related, prefetches = _loaded_fields(serializer)
+    if related:
+        queryset = queryset.select_related(*related)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset.only(*only or ['pk'])
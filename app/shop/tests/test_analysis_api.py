@@ -1,8 +1,13 @@
 """
 Tests for analysis api
 """
+import threading
+from datetime import date
 from decimal import Decimal
+from unittest.mock import patch
 
+from django.core.cache import caches
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -15,9 +20,19 @@ from shop.models import (
     OrderList,
     Order,
     OrderItem,
-    UserDeliveryInfo)
+    UserDeliveryInfo,
+    DailySales)
+from shop.analytics import (
+    bump_analytics_version,
+    get_analytics_version,
+    get_cached,
+    get_popularity,
+    rebuild_daily_sales,
+)
 
 LIST_ANALYSIS_URL = reverse('shop:data_analysis')
+SALES_SERIES_URL = reverse('shop:sales_series')
+POPULARITY_URL = reverse('shop:product_popularity')
 
 
 def create_product(**params):
@@ -91,6 +106,8 @@ class AnalysisAPIApiTest(TestCase):
 
     def setUp(self):
         self.client = APIClient()
+        # analytics versions restart when each test rolls back.
+        caches['analytics'].clear()
         self.user = create_user(
             email='user@example.com',
             password='test123')
@@ -110,3 +127,328 @@ class AnalysisAPIApiTest(TestCase):
         create_order(self.user)
         res = self.client.get(LIST_ANALYSIS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_get_analysis_reads_daily_sales(self):
+        """Test monthly sales are summed from the daily rollup"""
+        self.client.force_authenticate(user=self.admin_user)
+        DailySales.objects.create(
+            date=date(2023, 3, 1), order_count=2, revenue=Decimal('7.50'))
+        DailySales.objects.create(
+            date=date(2023, 3, 9), order_count=1, revenue=Decimal('2.50'))
+        create_product()
+
+        res = self.client.get(LIST_ANALYSIS_URL)
+
+        self.assertEqual(res.data['sales_per_month'][2]['sale'],
+                         Decimal('10.00'))
+
+    def test_get_analysis_cached(self):
+        """Test the analysis is cached until an order is placed"""
+        self.client.force_authenticate(user=self.admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_order(self.user)
+        self.client.get(LIST_ANALYSIS_URL)
+
+        # the analytics and catalog versions and the cached analysis.
+        with self.assertNumQueries(3):
+            res = self.client.get(LIST_ANALYSIS_URL)
+        self.assertEqual(res.data['sales_per_month'][date.today().month - 1]
+                         ['sale'], Decimal('5.25'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_order(self.user)
+        res = self.client.get(LIST_ANALYSIS_URL)
+
+        self.assertEqual(res.data['sales_per_month'][date.today().month - 1]
+                         ['sale'], Decimal('10.50'))
+
+
+class DailySalesTests(TestCase):
+    """Test the daily sales rollup"""
+
+    def setUp(self):
+        self.user = create_user(
+            email='user@example.com',
+            password='test123')
+
+    def test_orders_rolled_up(self):
+        """Test new orders are added to the sales of their day"""
+        # the sales are recorded once the orders commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            orders = [create_order(self.user) for _ in range(2)]
+            orders[1].order.add(OrderItem.objects.create(
+                user=self.user, product=create_product(), quantity=3))
+
+        day = DailySales.objects.get(date=orders[0].date_ordered)
+        self.assertEqual(day.order_count, 2)
+        self.assertEqual(day.revenue, Decimal('10.50'))
+        self.assertEqual(day.items_sold, 5)
+
+    def test_rebuild_daily_sales(self):
+        """Test the rollup is rebuilt from the orders"""
+        orders = [create_order(self.user) for _ in range(3)]
+        Order.objects.filter(id=orders[0].id).update(
+            date_ordered=date(2023, 1, 1))
+        DailySales.objects.create(date=date(2022, 1, 1), order_count=9)
+
+        days = rebuild_daily_sales()
+
+        self.assertEqual(days, 2)
+        self.assertEqual(
+            list(DailySales.objects.order_by('date').values_list(
+                'date', 'order_count', 'revenue', 'items_sold')),
+            [(date(2023, 1, 1), 1, Decimal('5.25'), 1),
+             (orders[1].date_ordered, 2, Decimal('10.50'), 2)])
+
+
+class AnalyticsCacheTests(TestCase):
+    """Test the analytics result cache"""
+
+    def setUp(self):
+        caches['analytics'].clear()
+
+    def test_cached_per_params(self):
+        """Test results are cached per parameter set"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(get_cached('test', {'n': 1}, compute), 1)
+        self.assertEqual(get_cached('test', {'n': 1}, compute), 1)
+        self.assertEqual(get_cached('test', {'n': 2}, compute), 2)
+
+    def test_order_bumps_version_on_commit(self):
+        """Test order writes invalidate the cache once committed"""
+        version = get_analytics_version()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            create_order(create_user(email='user@example.com'))
+            self.assertEqual(get_analytics_version(), version)
+        for callback in callbacks:
+            callback()
+
+        self.assertGreater(get_analytics_version(), version)
+
+    def test_order_rolled_up_before_version_bump(self):
+        """Test the version only moves once the order is rolled up"""
+        rollups = []
+
+        def bump():
+            rollups.append(list(DailySales.objects.values_list(
+                'order_count', 'items_sold')))
+            bump_analytics_version()
+
+        with patch('shop.analytics.bump_analytics_version', bump), \
+                self.captureOnCommitCallbacks(execute=True):
+            create_order(create_user(email='user@example.com'))
+
+        self.assertTrue(rollups)
+        self.assertTrue(all(rollup for rollup in rollups))
+        self.assertEqual(rollups[-1], [(1, 1)])
+
+    def run_in_thread(self, target):
+        """Run ``target`` in a thread on its own database connection."""
+        def run():
+            try:
+                target()
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_single_flight(self):
+        """Test a miss waits for the request already computing it"""
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def compute():
+            started.set()
+            release.wait(5)
+            return 'fresh'
+
+        # the thread holds the lock, the second miss must not compute.
+        thread = self.run_in_thread(
+            lambda: results.append(get_cached('test', {}, compute)))
+        started.wait(5)
+        threading.Timer(0.2, release.set).start()
+
+        result = get_cached('test', {}, self.fail)
+        thread.join()
+        # the thread committed its result outside the test transaction.
+        self.run_in_thread(caches['analytics'].clear).join()
+
+        self.assertEqual(result, 'fresh')
+        self.assertEqual(results, ['fresh'])
+
+
+class SalesSeriesApiTests(TestCase):
+    """Test the sales time series API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        # analytics versions restart when each test rolls back.
+        caches['analytics'].clear()
+        self.user = create_user(
+            email='user@example.com',
+            password='test123')
+        self.admin_user = create_admin_user(
+            email='admin@example.com',
+            password='test123')
+        self.client.force_authenticate(user=self.admin_user)
+
+    def create_dated_order(self, date_ordered):
+        """Create and return an order placed on ``date_ordered``."""
+        order = create_order(self.user)
+        Order.objects.filter(id=order.id).update(date_ordered=date_ordered)
+        return order
+
+    def test_sales_series_user(self):
+        """Test users can't get the sales series"""
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(SALES_SERIES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_sales_series_orders(self):
+        """Test short ranges are bucketed from the orders"""
+        for day in (date(2023, 1, 1), date(2023, 1, 1), date(2023, 1, 3),
+                    date(2023, 2, 1)):
+            self.create_dated_order(day)
+
+        res = self.client.get(SALES_SERIES_URL, {
+            'from': '2023-01-01', 'to': '2023-01-31'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['source'], 'orders')
+        self.assertEqual(res.data['granularity'], 'day')
+        self.assertEqual(
+            [(period['period'], period['orders'], period['revenue'])
+             for period in res.data['series']],
+            [('2023-01-01', 2, '10.50'), ('2023-01-03', 1, '5.25')])
+
+    def test_sales_series_years(self):
+        """Test long ranges keep years apart and read the rollup"""
+        DailySales.objects.create(
+            date=date(2023, 1, 5), order_count=2, revenue=Decimal('7.50'))
+        DailySales.objects.create(
+            date=date(2024, 1, 5), order_count=1, revenue=Decimal('2.50'))
+
+        res = self.client.get(SALES_SERIES_URL, {
+            'from': '2023-01-01', 'to': '2024-12-31',
+            'granularity': 'month'})
+
+        self.assertEqual(res.data['source'], 'daily_sales')
+        self.assertEqual(
+            [(period['period'], period['orders'])
+             for period in res.data['series']],
+            [('2023-01-01', 2), ('2024-01-01', 1)])
+
+    def test_sales_series_coarsened(self):
+        """Test too many buckets fall back to a coarser granularity"""
+        res = self.client.get(SALES_SERIES_URL, {
+            'from': '2021-01-01', 'to': '2023-12-31'})
+
+        self.assertEqual(res.data['granularity'], 'week')
+
+    def test_sales_series_invalid(self):
+        """Test reversed and too long ranges are rejected"""
+        res = self.client.get(SALES_SERIES_URL, {
+            'from': '2023-02-01', 'to': '2023-01-01'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(SALES_SERIES_URL, {
+            'from': '1000-01-01', 'to': '2024-01-01',
+            'granularity': 'year'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # to defaults to today, so a future from is reversed too.
+        res = self.client.get(SALES_SERIES_URL, {'from': '9999-01-01'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PopularityApiTests(TestCase):
+    """Test the product popularity API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        # analytics versions restart when each test rolls back.
+        caches['analytics'].clear()
+        self.user = create_user(
+            email='user@example.com',
+            password='test123')
+        self.admin_user = create_admin_user(
+            email='admin@example.com',
+            password='test123')
+        self.client.force_authenticate(user=self.admin_user)
+        # bulk: 5 units in one order, single: 1 unit in each of two
+        # orders and unsold never ordered.
+        self.bulk = create_product(name='Bulk', price=Decimal('1.00'))
+        self.single = create_product(name='Single', price=Decimal('9.00'))
+        self.unsold = create_product(name='Unsold')
+        self.add_order(date(2023, 1, 1), (self.bulk, 5), (self.single, 1))
+        self.add_order(date(2023, 2, 1), (self.single, 1))
+
+    def add_order(self, date_ordered, *lines):
+        """Create and return an order of ``lines`` on ``date_ordered``."""
+        order = Order.objects.create(
+            user=self.user, email=self.user.email,
+            total_price=Decimal('5.25'))
+        Order.objects.filter(id=order.id).update(date_ordered=date_ordered)
+        for product, quantity in lines:
+            order.order.add(OrderItem.objects.create(
+                user=self.user, product=product, quantity=quantity))
+        return order
+
+    def ranked_names(self, res, end):
+        """Return the product names at one end of the ranking."""
+        return [entry['product']['name'] for entry in res.data[end]]
+
+    def test_popularity_user(self):
+        """Test users can't get product popularity"""
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(POPULARITY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_popularity_units(self):
+        """Test products are ranked by units in one query"""
+        with self.assertNumQueries(1):
+            popularity = get_popularity(n=2)
+        self.assertEqual([product.name for product in popularity['top']],
+                         ['Bulk', 'Single'])
+
+        res = self.client.get(POPULARITY_URL, {'n': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.ranked_names(res, 'top'), ['Bulk', 'Single'])
+        self.assertEqual(
+            self.ranked_names(res, 'bottom'), ['Unsold', 'Single'])
+        self.assertEqual(res.data['top'][0]['units'], 5)
+        self.assertEqual(res.data['top'][1]['orders'], 2)
+
+    def test_popularity_orders_and_revenue(self):
+        """Test products can be ranked by orders or revenue"""
+        res = self.client.get(POPULARITY_URL, {'n': 1, 'by': 'orders'})
+        self.assertEqual(self.ranked_names(res, 'top'), ['Single'])
+        self.assertEqual(self.ranked_names(res, 'bottom'), ['Unsold'])
+
+        res = self.client.get(POPULARITY_URL, {'n': 1, 'by': 'revenue'})
+        self.assertEqual(self.ranked_names(res, 'top'), ['Single'])
+        self.assertEqual(res.data['top'][0]['revenue'], '18.00')
+
+    def test_popularity_date_range(self):
+        """Test only orders in the range count"""
+        res = self.client.get(POPULARITY_URL, {
+            'n': 1, 'by': 'orders', 'from': '2023-01-15'})
+
+        self.assertEqual(self.ranked_names(res, 'top'), ['Single'])
+        self.assertEqual(res.data['top'][0]['orders'], 1)
@@ -11,10 +11,12 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
-from shop.models import Product, CartItem
+from shop.models import Product, Cart, CartItem
 
 
 LIST_CART_Items_URL = reverse('shop:user_cart_items-list')
+BATCH_CART_Items_URL = reverse('shop:user_cart_items-batch')
+CART_URL = reverse('shop:user_cart-list')
 
 
 def cartItem_delete_url(cartItem_id):
@@ -61,6 +63,103 @@ class CartUserApiTest(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_list_cartItems_not_modified(self):
+        """Test cart is not resent while it is unchanged"""
+        product = create_product()
+        res = self.client.get(LIST_CART_Items_URL)
+        etag = res['ETag']
+
+        res = self.client.get(LIST_CART_Items_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        payload = {
+            "user": self.user.id,
+            "product": product.id,
+            "quantity": 1
+        }
+        self.client.post(LIST_CART_Items_URL, payload)
+        res = self.client.get(LIST_CART_Items_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+
+    def test_list_cartItems_sparse_fields(self):
+        """Test cart can be listed without some product fields"""
+        product = create_product()
+        CartItem.objects.create(user=self.user, product=product, quantity=2)
+
+        res = self.client.get(
+            LIST_CART_Items_URL,
+            {'omit': 'product.description_long'})
+
+        self.assertEqual(res.data[0]['quantity'], 2)
+        self.assertEqual(res.data[0]['product']['id'], product.id)
+        self.assertNotIn('description_long', res.data[0]['product'])
+
+    def test_list_cartItems_totals(self):
+        """Test cart totals are summed by the database"""
+        CartItem.objects.create(
+            user=self.user,
+            product=create_product(price=Decimal('5.25')),
+            quantity=2)
+        CartItem.objects.create(
+            user=self.user,
+            product=create_product(price=Decimal('1.10')),
+            quantity=3)
+
+        res = self.client.get(LIST_CART_Items_URL, {'totals': 'true'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['line_total'] for item in res.data['items']],
+            ['10.50', '3.30'])
+        self.assertEqual(res.data['item_count'], 5)
+        self.assertEqual(res.data['total'], '13.80')
+
+    def test_list_cartItems_totals_empty(self):
+        """Test an empty cart totals to zero"""
+        res = self.client.get(LIST_CART_Items_URL, {'totals': 'true'})
+
+        self.assertEqual(res.data['items'], [])
+        self.assertEqual(res.data['item_count'], 0)
+        self.assertEqual(res.data['total'], '0.00')
+
+    def test_get_cart(self):
+        """Test the cart is read with its items in one query"""
+        products = [create_product(), create_product()]
+        for quantity, product in enumerate(products, start=1):
+            CartItem.objects.create(
+                user=self.user, product=product, quantity=quantity)
+
+        with self.assertNumQueries(4):
+            # cart version, catalog version, the cart and its totals.
+            res = self.client.get(CART_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], Cart.objects.get(user=self.user).id)
+        self.assertEqual(
+            [(item['product']['id'], item['quantity'])
+             for item in res.data['items']],
+            [(products[0].id, 1), (products[1].id, 2)])
+        self.assertEqual(res.data['item_count'], 3)
+        self.assertEqual(res.data['total'], '15.75')
+
+    def test_get_cart_empty(self):
+        """Test an empty cart still has its id"""
+        res = self.client.get(CART_URL)
+
+        self.assertEqual(res.data['id'], Cart.objects.get(user=self.user).id)
+        self.assertEqual(res.data['items'], [])
+
+    def test_get_cart_detail_not_routed(self):
+        """Test the cart is only read through the list route"""
+        cart = Cart.objects.get(user=self.user)
+
+        res = self.client.get(f'{CART_URL}{cart.id}/')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_post_cartItems(self):
         """Test cart items can be posted"""
         product = create_product()
@@ -72,6 +171,100 @@ class CartUserApiTest(TestCase):
         res = self.client.post(LIST_CART_Items_URL, payload)
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
 
+    def test_post_cartItems_existing(self):
+        """Test posting a product already in the cart adds to it"""
+        product = create_product()
+        payload = {
+            "user": self.user.id,
+            "product": product.id,
+            "quantity": 2
+        }
+        self.client.post(LIST_CART_Items_URL, payload)
+
+        # the upsert and its product come back in one statement.
+        with self.assertNumQueries(1):
+            res = self.client.post(LIST_CART_Items_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['quantity'], 4)
+        self.assertEqual(res.data['line_total'], '21.00')
+        self.assertEqual(res.data['product']['id'], product.id)
+        cart_item = CartItem.objects.get(user=self.user, product=product)
+        self.assertEqual(cart_item.id, res.data['cart_item_id'])
+        self.assertEqual(cart_item.quantity, 4)
+
+    def test_post_cartItems_invalid_product(self):
+        """Test cart items can't be posted for missing products"""
+        payload = {
+            "user": self.user.id,
+            "product": 999999,
+            "quantity": 1
+        }
+        res = self.client.post(LIST_CART_Items_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_post_cartItems_too_many(self):
+        """Test quantities past the limit are rejected"""
+        payload = {
+            "user": self.user.id,
+            "product": create_product().id,
+            "quantity": 3000000000
+        }
+        res = self.client.post(LIST_CART_Items_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_batch_cartItems(self):
+        """Test many cart operations can be applied at once"""
+        kept, changed, removed, added = [create_product() for i in range(4)]
+        for product in (kept, changed, removed):
+            CartItem.objects.create(
+                user=self.user, product=product, quantity=1)
+        payload = [
+            {"product": kept.id, "quantity": 2, "op": "add"},
+            {"product": changed.id, "quantity": 5, "op": "set"},
+            {"product": removed.id, "op": "remove"},
+            {"product": added.id, "quantity": 1, "op": "add"},
+            {"product": added.id, "quantity": 3, "op": "add"},
+        ]
+
+        res = self.client.post(BATCH_CART_Items_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['product']['id'], item['quantity']) for item in res.data],
+            [(kept.id, 3), (changed.id, 5), (added.id, 4)])
+        self.assertFalse(
+            CartItem.objects.filter(user=self.user, product=removed).exists())
+
+    def test_batch_cartItems_invalid_product(self):
+        """Test a batch with a missing product changes nothing"""
+        product = create_product()
+        payload = [
+            {"product": product.id, "quantity": 1, "op": "add"},
+            {"product": 999999, "quantity": 1, "op": "add"},
+        ]
+
+        res = self.client.post(BATCH_CART_Items_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_batch_cartItems_too_many(self):
+        """Test a batch with a quantity past the limit changes nothing"""
+        payload = [
+            {"product": create_product().id, "quantity": 3000000000,
+             "op": "set"},
+        ]
+
+        res = self.client.post(BATCH_CART_Items_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CartItem.objects.exists())
+
     def test_delete_cartItems(self):
         """Test cart items can be deleted"""
 
@@ -0,0 +1,119 @@
+"""
+Test shop management commands.
+"""
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from shop.models import (
+    Product,
+    IdempotencyKey,
+    Order,
+    OrderItem,
+    DailySales)
+
+
+class ImportProductsCommandTests(TestCase):
+    """Test the import_products command."""
+
+    def test_import_products(self):
+        """Test products are imported in batches from a file."""
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as file:
+            for i in range(5):
+                file.write(json.dumps({
+                    'name': f'Product {i}',
+                    'image_url': 'http://example.com/product.png',
+                    'price': '5.25',
+                    'description_short': 'Short',
+                    'description_long': 'Long',
+                }) + '\n')
+            file.write('{"name": "Broken"}\n')
+            file.flush()
+            out = StringIO()
+
+            call_command(
+                'import_products', file.name,
+                batch_size=2, stdout=out, stderr=StringIO())
+
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertIn('Imported 5 products, 1 failed.', out.getvalue())
+
+
+class PurgeIdempotencyKeysCommandTests(TestCase):
+    """Test the purge_idempotency_keys command."""
+
+    def test_purge_idempotency_keys(self):
+        """Test only keys older than the given age are deleted."""
+        for key in ('old', 'new'):
+            IdempotencyKey.objects.create(
+                key=key, path='/api/shop/deliveryinfo/', request_hash='x')
+        IdempotencyKey.objects.filter(key='old').update(
+            created=timezone.now() - timedelta(hours=25))
+        out = StringIO()
+
+        call_command('purge_idempotency_keys', stdout=out)
+
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list('key', flat=True)),
+            ['new'])
+        self.assertIn('Deleted 1 idempotency keys.', out.getvalue())
+
+
+class ExportOrdersCommandTests(TestCase):
+    """Test the export_orders command."""
+
+    def test_export_orders(self):
+        """Test orders are exported in chunks to a file."""
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123')
+        product = Product.objects.create(
+            name='Sample product title',
+            image_url='http://example.com/product.png',
+            price=Decimal('5.25'),
+            description_short='Short',
+            description_long='Long')
+        for _ in range(3):
+            order = Order.objects.create(
+                user=user, email=user.email, total_price=Decimal('5.25'))
+            order.order.add(OrderItem.objects.create(
+                user=user, product=product, quantity=2))
+
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as file:
+            call_command(
+                'export_orders', output=file.name,
+                chunk_size=2, stdout=StringIO())
+            orders = [json.loads(line) for line in file]
+
+        self.assertEqual(len(orders), 3)
+        self.assertEqual(orders[0]['items'][0]['product'], product.id)
+
+
+class RebuildDailySalesCommandTests(TestCase):
+    """Test the rebuild_daily_sales command."""
+
+    def test_rebuild_daily_sales(self):
+        """Test the rollup is recomputed for the given days only."""
+        today = timezone.localdate().isoformat()
+        Order.objects.create(email='user@example.com',
+                             total_price=Decimal('5.25'))
+        # a drifted row for today, the rollup only runs on commit.
+        DailySales.objects.create(date=today, order_count=7)
+        DailySales.objects.create(date='2020-01-01', order_count=3)
+        out = StringIO()
+
+        call_command(
+            'rebuild_daily_sales', date_from=today, date_to=today,
+            stdout=out)
+
+        self.assertEqual(
+            DailySales.objects.get(date=today).order_count, 1)
+        self.assertEqual(
+            DailySales.objects.get(date='2020-01-01').order_count, 3)
+        self.assertIn('Rebuilt daily sales for 1 days.', out.getvalue())
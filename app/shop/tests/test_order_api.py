@@ -1,10 +1,15 @@
 """
 Tests for order api
 """
+import csv
+import json
+from datetime import date
 from decimal import Decimal
 
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 
 from rest_framework.test import APIClient
@@ -12,15 +17,21 @@ from rest_framework import status
 
 from shop.models import (
     Product,
-    Cart,
     CartItem,
     OrderList,
     Order,
     OrderItem,
-    UserDeliveryInfo)
+    UserDeliveryInfo,
+    IdempotencyKey,
+    DailySales)
 
 LIST_ORDER_URL = reverse('shop:user_orders-list')
 CREATE_ORDER_URL = reverse('shop:user_delivery_info-list')
+CREATE_ANONYMOUS_ORDER_URL = reverse('shop:post_orders_anonymously')
+SEARCH_ORDER_URL = reverse('shop:search_orders')
+TRACK_ORDER_URL = reverse('shop:track_order')
+EXPORT_ORDER_URL = reverse('shop:export_orders')
+BULK_STATUS_ORDER_URL = reverse('shop:bulk_status_orders')
 
 
 def get_order_specific_url(order_id):
@@ -91,6 +102,39 @@ def create_user(**params):
     return get_user_model().objects.create_user(**params)
 
 
+def create_admin_user(**params):
+    """Create and return a admin user."""
+    user = get_user_model().objects.create_user(**params)
+    user.is_staff = True
+    user.save()
+    return user
+
+
+def create_checkout_payload(user=None, **params):
+    """Create and return a sample checkout payload."""
+    delivery_info = {
+        'first_name': "Test",
+        "last_name": "Boy",
+        "email": user.email if user else "anonymous@example.com",
+        "phone_number": "+44 7700 900077",
+        "address": "Marylebone, London",
+        "city": "London",
+        "country": "United Kingdom",
+        "post_code": "NW10 4UX",
+        "delivery_type": "Standard",
+    }
+    if user:
+        delivery_info['user'] = user.id
+    delivery_info.update(params)
+    return [
+        delivery_info,
+        {
+            "delivery_msg": "Sample Delivery Message",
+            "total_price": Decimal('5.25'),
+        }
+        ]
+
+
 class OrderUserApiTest(TestCase):
     """Test authenticated user order API request"""
 
@@ -109,6 +153,56 @@ class OrderUserApiTest(TestCase):
         res = self.client.get(LIST_ORDER_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_list_orders_sparse_fields(self):
+        """Test orders can be listed with only some fields"""
+        order = create_order(self.user)
+
+        res = self.client.get(
+            LIST_ORDER_URL,
+            {'fields': 'id,order.quantity,order.product.name'})
+
+        self.assertEqual(res.data, [{
+            'id': order.id,
+            'order': [{
+                'quantity': 1,
+                'product': {'name': 'Sample product title'},
+                }],
+            }])
+
+    def test_list_orders_query_count(self):
+        """Test staff list orders with a fixed number of queries"""
+        admin = create_admin_user(
+            email='admin@example.com', password='test123')
+        for _ in range(3):
+            order = create_order(self.user)
+            for _ in range(2):
+                order.order.add(OrderItem.objects.create(
+                    user=self.user, product=create_product(), quantity=2))
+        self.client.force_authenticate(user=admin)
+
+        # orders with their delivery info, then items with products.
+        with self.assertNumQueries(2):
+            res = self.client.get(LIST_ORDER_URL)
+
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(
+            [len(order['order']) for order in res.data], [3, 3, 3])
+        self.assertEqual(
+            res.data[0]['personal_info_used']['email'], "test@admin.com")
+
+    def test_list_specific_order_query_count(self):
+        """Test an order is read with a fixed number of queries"""
+        order = create_order(self.user)
+        for _ in range(3):
+            order.order.add(OrderItem.objects.create(
+                user=self.user, product=create_product(), quantity=2))
+
+        with self.assertNumQueries(2):
+            res = self.client.get(get_order_specific_url(order.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['order']), 4)
+
     def test_list_specific_order(self):
         """Test Authenticated users can retrieve specific order"""
 
@@ -155,13 +249,139 @@ class OrderUserApiTest(TestCase):
             "product": product,
             "quantity": 1
         }
-        cart = Cart.objects.get(user=self.user)
-        cart_item = CartItem.objects.create(**cartItemData_test)
-        cart.products.add(cart_item)
+        CartItem.objects.create(**cartItemData_test)
         self.client.force_authenticate(user=self.user)
         res = self.client.post(CREATE_ORDER_URL, data=payload, format='json')
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
 
+    def test_post_orders_cart(self):
+        """Test checkout orders every cart item and clears the cart"""
+        products = [create_product(), create_product()]
+        for quantity, product in enumerate(products, start=1):
+            CartItem.objects.create(
+                user=self.user, product=product, quantity=quantity)
+        payload = create_checkout_payload(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                CREATE_ORDER_URL, data=payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(id=res.data['id'])
+        self.assertEqual(sorted(res.data['order']), sorted(
+            order.order.values_list('id', flat=True)))
+        self.assertEqual(
+            sorted(order.order.values_list('product', 'quantity')),
+            [(products[0].id, 1), (products[1].id, 2)])
+        self.assertEqual(order.personal_info_used.email, self.user.email)
+        self.assertEqual(order.delivery_instructions,
+                         "Sample Delivery Message")
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+        day = DailySales.objects.get(date=order.date_ordered)
+        self.assertEqual((day.order_count, day.items_sold), (1, 3))
+
+    def test_post_orders_total_price(self):
+        """Test the order total is computed, not taken from the client"""
+        CartItem.objects.create(
+            user=self.user,
+            product=create_product(price=Decimal('400.00')),
+            quantity=3)
+        payload = create_checkout_payload(self.user)
+        payload[1]['total_price'] = Decimal('0.01')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                CREATE_ORDER_URL, data=payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(id=res.data['id'])
+        self.assertEqual(order.total_price, Decimal('1200.00'))
+        self.assertEqual(
+            DailySales.objects.get(date=order.date_ordered).revenue,
+            Decimal('1200.00'))
+
+    def test_post_orders_query_count(self):
+        """Test checkout runs the same queries however big the cart is"""
+        query_counts = []
+        for cart_size in (1, 10):
+            for _ in range(cart_size):
+                CartItem.objects.create(
+                    user=self.user, product=create_product(), quantity=1)
+            payload = create_checkout_payload(self.user)
+
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(
+                    CREATE_ORDER_URL, data=payload, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(res.data['order']), cart_size)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_post_orders_empty_cart(self):
+        """Test an empty cart can't be checked out"""
+        payload = create_checkout_payload(self.user)
+
+        res = self.client.post(CREATE_ORDER_URL, data=payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(UserDeliveryInfo.objects.exists())
+
+    def test_post_orders_idempotency_key_replay(self):
+        """Test a retried checkout replays the first order"""
+        CartItem.objects.create(
+            user=self.user, product=create_product(), quantity=1)
+        payload = create_checkout_payload(self.user)
+        res = self.client.post(
+            CREATE_ORDER_URL, data=payload, format='json',
+            HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        retry = self.client.post(
+            CREATE_ORDER_URL, data=payload, format='json',
+            HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, res.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_post_orders_idempotency_key_other_request(self):
+        """Test a key can't be reused for a different checkout"""
+        CartItem.objects.create(
+            user=self.user, product=create_product(), quantity=1)
+        self.client.post(
+            CREATE_ORDER_URL, data=create_checkout_payload(self.user),
+            format='json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        res = self.client.post(
+            CREATE_ORDER_URL,
+            data=create_checkout_payload(self.user, city="Leeds"),
+            format='json', HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_post_orders_idempotency_key_failure(self):
+        """Test a failed checkout doesn't use up its key"""
+        payload = create_checkout_payload(self.user)
+        res = self.client.post(
+            CREATE_ORDER_URL, data=payload, format='json',
+            HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        CartItem.objects.create(
+            user=self.user, product=create_product(), quantity=1)
+        res = self.client.post(
+            CREATE_ORDER_URL, data=payload, format='json',
+            HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 1)
+
     def test_post_order_hacker(self):
         """Test hacker can't post order in others name"""
         payload = [
@@ -188,9 +408,331 @@ class OrderUserApiTest(TestCase):
             "product": product,
             "quantity": 1
         }
-        cart = Cart.objects.get(user=self.user)
-        cart_item = CartItem.objects.create(**cartItemData_test)
-        cart.products.add(cart_item)
+        CartItem.objects.create(**cartItemData_test)
         self.client.force_authenticate(user=self.hacker)
         res = self.client.post(CREATE_ORDER_URL, data=payload, format='json')
         self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OrderAnonymousApiTest(TestCase):
+    """Test anonymous order API request"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_post_orders_anonymous(self):
+        """Test anonymous users can post orders"""
+        products = [create_product(), create_product()]
+        payload = create_checkout_payload()
+        payload.append({'products': [
+            {'product_id': products[0].id, 'quantity': 1},
+            {'product_id': products[1].id, 'quantity': 3},
+            ]})
+
+        res = self.client.post(
+            CREATE_ANONYMOUS_ORDER_URL, data=payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        order = Order.objects.get(email="anonymous@example.com")
+        self.assertIsNone(order.user)
+        self.assertEqual(
+            sorted(order.order.values_list('product', 'quantity')),
+            [(products[0].id, 1), (products[1].id, 3)])
+        self.assertEqual(order.personal_info_used.email,
+                         "anonymous@example.com")
+        self.assertEqual(order.total_price, Decimal('21.00'))
+
+    def test_post_orders_anonymous_idempotency_key_replay(self):
+        """Test a retried anonymous order is only placed once"""
+        payload = create_checkout_payload()
+        payload.append({'products': [
+            {'product_id': create_product().id, 'quantity': 1}]})
+
+        responses = [
+            self.client.post(
+                CREATE_ANONYMOUS_ORDER_URL, data=payload, format='json',
+                HTTP_IDEMPOTENCY_KEY='anonymous-1')
+            for _ in range(2)]
+
+        self.assertEqual(responses[0].status_code, status.HTTP_200_OK)
+        self.assertEqual(responses[1].status_code, status.HTTP_200_OK)
+        self.assertEqual(responses[1].data, responses[0].data)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_track_order_anonymous(self):
+        """Test anonymous orders can be found by email and token"""
+        payload = create_checkout_payload()
+        payload.append({'products': [
+            {'product_id': create_product().id, 'quantity': 2}]})
+        res = self.client.post(
+            CREATE_ANONYMOUS_ORDER_URL, data=payload, format='json')
+        order = Order.objects.get(id=res.data['order'])
+        self.assertEqual(res.data['token'], order.token)
+
+        res = self.client.post(TRACK_ORDER_URL, {
+            'email': "anonymous@example.com",
+            'token': order.token}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], order.id)
+        self.assertEqual(res.data['order'][0]['quantity'], 2)
+        self.assertEqual(res.data['delivery_status'], "Processing Order")
+
+    def test_track_order_anonymous_wrong_token(self):
+        """Test orders aren't found without their email and token"""
+        order = create_order(create_user(
+            email='user@example.com', password='test123'))
+
+        for email, token in [("test@admin.com", "not-the-token"),
+                             ("other@example.com", order.token)]:
+            res = self.client.post(TRACK_ORDER_URL, {
+                'email': email, 'token': token}, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_post_orders_anonymous_query_count(self):
+        """Test anonymous orders run the same queries for any basket"""
+        query_counts = []
+        for basket_size in (1, 10):
+            payload = create_checkout_payload()
+            payload.append({'products': [
+                {'product_id': create_product().id, 'quantity': 1}
+                for _ in range(basket_size)]})
+
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(
+                    CREATE_ANONYMOUS_ORDER_URL, data=payload, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_post_orders_anonymous_invalid_product(self):
+        """Test nothing is saved when any product doesn't exist"""
+        product = create_product()
+        payload = create_checkout_payload()
+        payload.append({'products': [
+            {'product_id': product.id, 'quantity': 1},
+            {'product_id': 999999, 'quantity': 1},
+            ]})
+
+        res = self.client.post(
+            CREATE_ANONYMOUS_ORDER_URL, data=payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(UserDeliveryInfo.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+    def test_post_orders_anonymous_too_many(self):
+        """Test quantities past the limit are rejected"""
+        payload = create_checkout_payload()
+        payload.append({'products': [
+            {'product_id': create_product().id, 'quantity': 3000000000},
+            ]})
+
+        res = self.client.post(
+            CREATE_ANONYMOUS_ORDER_URL, data=payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderSearchApiTest(TestCase):
+    """Test the staff order search API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.admin = create_admin_user(
+            email='admin@example.com', password='test123')
+        self.client.force_authenticate(user=self.admin)
+
+    def create_dated_order(self, date_ordered, **params):
+        """Create and return an order placed on ``date_ordered``."""
+        order = create_order(self.user, **params)
+        Order.objects.filter(id=order.id).update(date_ordered=date_ordered)
+        return order
+
+    def test_search_orders_user(self):
+        """Test users can't search every order"""
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(SEARCH_ORDER_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_search_orders_pages(self):
+        """Test orders are paged newest first without gaps or repeats"""
+        dates = [date(2023, 1, 1), date(2023, 1, 2), date(2023, 1, 2),
+                 date(2023, 1, 2), date(2023, 1, 3)]
+        orders = [self.create_dated_order(day) for day in dates]
+        expected = [orders[4].id, orders[3].id, orders[2].id,
+                    orders[1].id, orders[0].id]
+
+        seen = []
+        url = SEARCH_ORDER_URL + '?limit=2'
+        while url:
+            with self.assertNumQueries(2):
+                res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(res.data['results']), 2)
+            seen += [order['id'] for order in res.data['results']]
+            url = res.data['next']
+
+        self.assertEqual(seen, expected)
+
+    def test_search_orders_filters(self):
+        """Test orders can be filtered by status, dates and email"""
+        self.create_dated_order(date(2023, 1, 1))
+        match = self.create_dated_order(
+            date(2023, 2, 1), email='match@example.com')
+        Order.objects.filter(id=match.id).update(delivery_status='Shipped')
+        self.create_dated_order(date(2023, 3, 1), email='match@example.com')
+
+        res = self.client.get(SEARCH_ORDER_URL, {
+            'delivery_status': 'Shipped',
+            'date_from': '2023-01-15',
+            'date_to': '2023-02-15',
+            'email': 'match@example.com',
+            'user': self.user.id,
+            })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [order['id'] for order in res.data['results']], [match.id])
+        self.assertIsNone(res.data['next'])
+
+    def test_search_orders_invalid(self):
+        """Test bad filters and cursors are rejected"""
+        res = self.client.get(SEARCH_ORDER_URL, {
+            'date_from': '2023-02-01', 'date_to': '2023-01-01'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(SEARCH_ORDER_URL, {'cursor': 'nonsense'})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OrderExportApiTest(TestCase):
+    """Test the staff order export API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.admin = create_admin_user(
+            email='admin@example.com', password='test123')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_export_orders_user(self):
+        """Test users can't export orders"""
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(EXPORT_ORDER_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_orders_jsonl(self):
+        """Test orders stream as one JSON object per line"""
+        orders = [create_order(self.user) for _ in range(2)]
+        orders[1].order.add(OrderItem.objects.create(
+            user=self.user, product=create_product(), quantity=3))
+
+        res = self.client.get(EXPORT_ORDER_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        exported = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [order['id'] for order in exported],
+            [order.id for order in orders])
+        self.assertEqual(
+            [item['quantity'] for item in exported[1]['items']], [1, 3])
+        self.assertEqual(exported[0]['total_price'], '5.25')
+
+    def test_export_orders_csv(self):
+        """Test orders stream as CSV with a row per item"""
+        order = create_order(self.user)
+        order.order.add(OrderItem.objects.create(
+            user=self.user, product=create_product(), quantity=3))
+        Order.objects.filter(id=order.id).update(delivery_status='Shipped')
+        create_order(self.user)
+
+        res = self.client.get(EXPORT_ORDER_URL, {
+            'export_format': 'csv', 'delivery_status': 'Shipped'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(
+            b''.join(res.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row['order_id'] for row in rows}, {str(order.id)})
+        self.assertEqual([row['quantity'] for row in rows], ['1', '3'])
+
+    def test_export_orders_invalid_format(self):
+        """Test unknown export formats are rejected"""
+        res = self.client.get(EXPORT_ORDER_URL, {'export_format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderBulkStatusApiTest(TestCase):
+    """Test the staff bulk delivery status API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.admin = create_admin_user(
+            email='admin@example.com', password='test123')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_bulk_status_user(self):
+        """Test users can't change delivery statuses"""
+        order = create_order(self.user)
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.post(BULK_STATUS_ORDER_URL, {
+            'ids': [order.id],
+            'from_status': 'Processing Order',
+            'to_status': 'Delivered'}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_status(self):
+        """Test only orders in the expected status are moved"""
+        orders = [create_order(self.user) for _ in range(3)]
+        Order.objects.filter(id=orders[2].id).update(
+            delivery_status='Delivered')
+
+        with self.assertNumQueries(1):
+            res = self.client.post(BULK_STATUS_ORDER_URL, {
+                'ids': [order.id for order in orders] + [999999],
+                'from_status': 'Processing Order',
+                'to_status': 'Dispatched'}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['updated'], [orders[0].id, orders[1].id])
+        self.assertEqual(res.data['skipped'], [orders[2].id, 999999])
+        self.assertEqual(
+            list(Order.objects.order_by('id')
+                 .values_list('delivery_status', flat=True)),
+            ['Dispatched', 'Dispatched', 'Delivered'])
+
+    def test_bulk_status_admin_action(self):
+        """Test the admin action dispatches processing orders"""
+        self.admin.is_superuser = True
+        self.admin.save()
+        self.client.force_login(self.admin)
+        orders = [create_order(self.user) for _ in range(2)]
+        Order.objects.filter(id=orders[1].id).update(
+            delivery_status='Delivered')
+
+        res = self.client.post(reverse('admin:shop_order_changelist'), {
+            'action': 'mark_dispatched',
+            '_selected_action': [order.id for order in orders]})
+
+        self.assertEqual(res.status_code, status.HTTP_302_FOUND)
+        orders[0].refresh_from_db()
+        orders[1].refresh_from_db()
+        self.assertEqual(orders[0].delivery_status, 'Dispatched')
+        self.assertEqual(orders[1].delivery_status, 'Delivered')
@@ -1,22 +1,30 @@
 """
 Tests for product api
 """
+import json
 from decimal import Decimal
 
 
 from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
 from rest_framework.test import APIClient
 from rest_framework import status
 
-from shop.models import Product
+from shop.models import Product, Cart, CartItem, Order, OrderItem
 from shop.serializers import ProductSerializer
 
 
 LIST_PRODUCTS_URL = reverse('shop:products-list')
 CREATE_PRODUCTS_URL = reverse('shop:create_product')
+SEARCH_PRODUCTS_URL = reverse('shop:search_products')
+PRODUCT_CATEGORIES_URL = reverse('shop:product_categories')
+IMPORT_PRODUCTS_URL = reverse('shop:import_products')
+BULK_DELETE_PRODUCTS_URL = reverse('shop:bulk_delete_products')
+BULK_PRICE_PRODUCTS_URL = reverse('shop:bulk_price_products')
 
 
 def create_product(**params):
@@ -63,6 +71,8 @@ class PublicApiTestProduct(TestCase):
 
     def setUp(self):
         self.client = APIClient()
+        # catalog versions restart when each test rolls back.
+        cache.clear()
 
     def test_list_products(self):
         """Test products can be listed"""
@@ -73,7 +83,90 @@ class PublicApiTestProduct(TestCase):
         recipes = Product.objects.all().order_by('-id')
         serializer = ProductSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.json(), serializer.data)
+
+    def test_list_products_snapshot_invalidated(self):
+        """Test product writes are reflected in the cached catalog"""
+        product = create_product()
+        self.client.get(LIST_PRODUCTS_URL)
+
+        product.name = 'Renamed product'
+        product.save()
+        create_product(name='New product')
+        res = self.client.get(LIST_PRODUCTS_URL)
+
+        self.assertEqual(
+            [product['name'] for product in res.json()],
+            ['Renamed product', 'New product'])
+
+        product.delete()
+        res = self.client.get(LIST_PRODUCTS_URL)
+
+        self.assertEqual(
+            [product['name'] for product in res.json()],
+            ['New product'])
+
+    def test_list_products_snapshot_skips_orm(self):
+        """Test a cached catalog is served without querying products"""
+        create_product()
+        self.client.get(LIST_PRODUCTS_URL)
+
+        # only the catalog version is read.
+        with self.assertNumQueries(1):
+            res = self.client.get(LIST_PRODUCTS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_list_products_not_modified(self):
+        """Test catalog is not resent while it is unchanged"""
+        create_product()
+        res = self.client.get(LIST_PRODUCTS_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(LIST_PRODUCTS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        create_product(name='New product')
+        res = self.client.get(LIST_PRODUCTS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_list_products_sparse_fields(self):
+        """Test products can be listed with only some fields"""
+        product = create_product()
+
+        res = self.client.get(LIST_PRODUCTS_URL, {'fields': 'id,name'})
+
+        self.assertEqual(
+            res.json(),
+            [{'id': product.id, 'name': product.name}])
+
+        res = self.client.get(LIST_PRODUCTS_URL, {'omit': 'description_long'})
+
+        self.assertNotIn('description_long', res.json()[0])
+        self.assertIn('description_short', res.json()[0])
+
+    def test_list_products_cursor_pagination(self):
+        """Test products can be paged through with a cursor"""
+        products = [create_product(name=f'Product {i}') for i in range(3)]
+
+        res = self.client.get(LIST_PRODUCTS_URL, {'limit': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [product['id'] for product in res.data['results']],
+            [products[0].id, products[1].id])
+        self.assertIsNotNone(res.data['next'])
+
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(
+            [product['id'] for product in res.data['results']],
+            [products[2].id])
+        self.assertIsNone(res.data['next'])
 
     def test_specific_product(self):
         """Test specific products gets retrieved"""
@@ -87,6 +180,116 @@ class PublicApiTestProduct(TestCase):
         self.assertEqual(res.data, serializer.data)
 
 
+class SearchProductApiTests(TestCase):
+    """Test the product search API"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_search_products_ranked(self):
+        """Test search returns matches with name matches first"""
+        in_description = create_product(
+            name='Silver band',
+            description_long='Pairs well with a diamond necklace')
+        in_name = create_product(name='Diamond necklace')
+        create_product(name='Gold bracelet')
+
+        res = self.client.get(SEARCH_PRODUCTS_URL, {'q': 'diamond'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [product['id'] for product in res.data],
+            [in_name.id, in_description.id])
+
+    def test_search_products_after_update(self):
+        """Test search reflects updated products"""
+        product = create_product(name='Gold bracelet')
+        product.name = 'Platinum bracelet'
+        product.save()
+
+        res = self.client.get(SEARCH_PRODUCTS_URL, {'q': 'platinum'})
+
+        self.assertEqual([p['id'] for p in res.data], [product.id])
+
+    def test_search_products_limit(self):
+        """Test search results are limited"""
+        for i in range(3):
+            create_product(name=f'Ruby ring {i}')
+
+        res = self.client.get(SEARCH_PRODUCTS_URL, {'q': 'ruby', 'limit': 2})
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_search_products_requires_terms(self):
+        """Test search without terms is rejected"""
+        res = self.client.get(SEARCH_PRODUCTS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CategoryProductApiTests(TestCase):
+    """Test the product category API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_category_counts(self):
+        """Test every category is counted"""
+        create_product(catagory='Ring')
+        create_product(catagory='Ring')
+        create_product(catagory='Necklace')
+
+        res = self.client.get(PRODUCT_CATEGORIES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['categories'], [
+            {'name': 'Necklace', 'count': 1},
+            {'name': 'Ring', 'count': 2},
+        ])
+        self.assertEqual(res.data['products'], [])
+
+    def test_category_products(self):
+        """Test products of the requested category are returned"""
+        necklace = create_product(catagory='Necklace')
+        create_product(catagory='Ring')
+
+        res = self.client.get(PRODUCT_CATEGORIES_URL, {'category': 'Necklace'})
+
+        self.assertEqual(
+            [product['id'] for product in res.data['products']],
+            [necklace.id])
+
+    def test_category_products_paged(self):
+        """Test category products are returned a page at a time"""
+        necklaces = [create_product(catagory='Necklace') for _ in range(3)]
+
+        res = self.client.get(
+            PRODUCT_CATEGORIES_URL, {'category': 'Necklace', 'limit': 2})
+        next_page = self.client.get(res.data['next'])
+
+        self.assertEqual(
+            [product['id'] for product in res.data['products']],
+            [necklaces[0].id, necklaces[1].id])
+        self.assertEqual(
+            [product['id'] for product in next_page.data['products']],
+            [necklaces[2].id])
+        self.assertIsNone(next_page.data['next'])
+
+    def test_category_counts_follow_catalog(self):
+        """Test counts are recomputed when products change"""
+        product = create_product(catagory='Ring')
+        self.client.get(PRODUCT_CATEGORIES_URL)
+
+        product.catagory = 'Bracelet'
+        product.save()
+        res = self.client.get(PRODUCT_CATEGORIES_URL)
+
+        self.assertEqual(
+            res.data['categories'],
+            [{'name': 'Bracelet', 'count': 1}])
+
+
 class ProductCreateUserApiTests(TestCase):
     """Test authenticated user Product Create API requests."""
 
@@ -193,3 +396,175 @@ class ProductDeleteAdminApiTests(TestCase):
         res = self.client.delete(url)
 
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class ProductImportAdminApiTests(TestCase):
+    """Test Admin Product Import API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin_user = create_admin_user(
+            email='user@example.com',
+            password='test123')
+        self.client.force_authenticate(user=self.admin_user)
+
+    def test_product_import_jsonl(self):
+        """Test Admin can import products, bad rows are reported"""
+        existing = create_product()
+        rows = [
+            {'id': existing.id, 'name': 'Updated product', 'price': '9.99',
+             'image_url': 'http://example.com/product.png',
+             'description_short': 'Short', 'description_long': 'Long'},
+            {'name': 'New product', 'price': '1.50',
+             'image_url': 'http://example.com/product.png',
+             'description_short': 'Short', 'description_long': 'Long',
+             'catagory': 'Necklace'},
+            {'name': 'Missing price'},
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+        upload = SimpleUploadedFile('products.jsonl', content.encode())
+
+        res = self.client.post(
+            IMPORT_PRODUCTS_URL,
+            {'file': upload},
+            format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['imported'], 2)
+        self.assertEqual(res.data['failed'], 2)
+        self.assertEqual(
+            [error['line'] for error in res.data['errors']],
+            [3, 4])
+        existing.refresh_from_db()
+        self.assertEqual(existing.name, 'Updated product')
+        self.assertTrue(Product.objects.filter(name='New product').exists())
+        # the id sequence moved past the imported ids.
+        self.assertGreater(create_product().id, existing.id)
+
+    def test_product_import_csv(self):
+        """Test Admin can import products from CSV"""
+        content = (
+            'name,image_url,price,description_short,description_long\n'
+            'CSV product,http://example.com/p.png,2.00,Short,Long\n'
+        )
+        upload = SimpleUploadedFile('products.csv', content.encode())
+
+        res = self.client.post(
+            IMPORT_PRODUCTS_URL,
+            {'file': upload},
+            format='multipart')
+
+        self.assertEqual(res.data['imported'], 1)
+        self.assertTrue(Product.objects.filter(name='CSV product').exists())
+
+    def test_product_import_unreadable(self):
+        """Test an unreadable file is a 400 after the rows before it"""
+        row = {'id': 1000, 'name': 'Imported product', 'price': '1.50',
+               'image_url': 'http://example.com/product.png',
+               'description_short': 'Short', 'description_long': 'Long'}
+        content = json.dumps(row).encode() + b'\n\xff\xfe not utf-8\n'
+        upload = SimpleUploadedFile('products.jsonl', content)
+
+        res = self.client.post(
+            IMPORT_PRODUCTS_URL,
+            {'file': upload},
+            format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(res.data['aborted'])
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual(res.data['errors'][0]['line'], 2)
+        # the sequence still moved past the imported id.
+        self.assertGreater(create_product().id, 1000)
+
+    def test_product_import_user(self):
+        """Test authenticated user can't import products"""
+        user = create_user(email='other@example.com', password='test123')
+        self.client.force_authenticate(user=user)
+        upload = SimpleUploadedFile('products.jsonl', b'')
+
+        res = self.client.post(
+            IMPORT_PRODUCTS_URL,
+            {'file': upload},
+            format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BulkProductAdminApiTests(TestCase):
+    """Test Admin bulk Product API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin_user = create_admin_user(
+            email='user@example.com',
+            password='test123')
+        self.client.force_authenticate(user=self.admin_user)
+
+    def test_bulk_delete_products(self):
+        """Test Admin can delete products with their cart and order items"""
+        product = create_product()
+        kept = create_product(name='Kept product')
+        cart = Cart.objects.get(user=self.admin_user)
+        CartItem.objects.create(
+            user=self.admin_user, product=product, quantity=1)
+        order_item = OrderItem.objects.create(
+            user=self.admin_user, product=product, quantity=1)
+        order = Order.objects.create(
+            user=self.admin_user, total_price=Decimal('5.25'))
+        order.order.add(order_item)
+        cart_version = Cart.objects.get(pk=cart.pk).version
+
+        res = self.client.post(
+            BULK_DELETE_PRODUCTS_URL,
+            {'ids': [product.id]},
+            format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deleted'], 1)
+        self.assertEqual(list(Product.objects.all()), [kept])
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(order.order.exists())
+        cart.refresh_from_db()
+        self.assertGreater(cart.version, cart_version)
+
+    def test_bulk_price_products(self):
+        """Test Admin can re-price a catagory of products"""
+        ring = create_product(price=Decimal('10.00'), catagory='Ring')
+        necklace = create_product(price=Decimal('10.00'), catagory='Necklace')
+
+        res = self.client.post(
+            BULK_PRICE_PRODUCTS_URL,
+            {'catagory': 'Ring', 'percent': '-15'},
+            format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['updated'], 1)
+        ring.refresh_from_db()
+        necklace.refresh_from_db()
+        self.assertEqual(ring.price, Decimal('8.50'))
+        self.assertEqual(necklace.price, Decimal('10.00'))
+
+    def test_bulk_price_products_requires_selection(self):
+        """Test bulk price changes must select products"""
+        res = self.client.post(
+            BULK_PRICE_PRODUCTS_URL,
+            {'price': '1.00'},
+            format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_delete_products_user(self):
+        """Test authenticated user can't bulk delete products"""
+        product = create_product()
+        user = create_user(email='other@example.com', password='test123')
+        self.client.force_authenticate(user=user)
+
+        res = self.client.post(
+            BULK_DELETE_PRODUCTS_URL,
+            {'ids': [product.id]},
+            format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(Product.objects.filter(id=product.id).exists())
@@ -16,6 +16,11 @@ router.register(
     views.CartItemViewset,
     basename="user_cart_items"
     )
+router.register(
+    'cart',
+    views.ListCartView,
+    basename="user_cart"
+    )
 router.register(
     'orders',
     views.OrderViewset,
@@ -48,16 +53,71 @@ urlpatterns = [
         views.PostOrderAnonymousAPIView.as_view(),
         name='post_orders_anonymously'
         ),
+    path(
+        'orders/track',
+        views.TrackOrderAPIView.as_view(),
+        name='track_order'
+        ),
+    path(
+        'products/search',
+        views.SearchProductAPIView.as_view(),
+        name='search_products'
+        ),
+    path(
+        'products/categories',
+        views.CategoryProductAPIView.as_view(),
+        name='product_categories'
+        ),
+    path(
+        'products/bulk/delete',
+        views.BulkDeleteProductAPIView.as_view(),
+        name='bulk_delete_products'
+        ),
+    path(
+        'products/bulk/price',
+        views.BulkPriceProductAPIView.as_view(),
+        name='bulk_price_products'
+        ),
+    path(
+        'orders/search',
+        views.SearchOrderAPIView.as_view(),
+        name='search_orders'
+        ),
+    path(
+        'orders/export',
+        views.ExportOrderAPIView.as_view(),
+        name='export_orders'
+        ),
+    path(
+        'orders/bulk/status',
+        views.BulkStatusOrderAPIView.as_view(),
+        name='bulk_status_orders'
+        ),
     path(
         'create/product',
         views.CreateProduct.as_view(),
         name='create_product'
         ),
+    path(
+        'import/products',
+        views.ImportProductAPIView.as_view(),
+        name='import_products'
+        ),
     path(
         'analysis',
         views.DataAnalysisShopAPIView.as_view(),
         name='data_analysis'
         ),
+    path(
+        'analysis/sales',
+        views.SalesSeriesAPIView.as_view(),
+        name='sales_series'
+        ),
+    path(
+        'analysis/popularity',
+        views.PopularityAPIView.as_view(),
+        name='product_popularity'
+        ),
     path('external',
          views.ExternalAPIView.as_view(),
          name="external"),
@@ -4,13 +4,29 @@ Views for the shop API
 
 from rest_framework import authentication
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from shop.serializers import (
     ProductSerializer,
-    CartSerializer,
+    ProductSelectionSerializer,
+    ProductPriceSerializer,
+    CartReadSerializer,
     CartItemSerializer,
+    CartItemAddSerializer,
+    CartItemReadSerializer,
+    CartOperationSerializer,
+    CartTotalsSerializer,
+    CheckoutSerializer,
+    AnonymousCartSerializer,
     OrderSerializer,
     OrderReadSerializer,
+    OrderSearchSerializer,
+    OrderStatusSerializer,
+    OrderTrackSerializer,
+    SalesSeriesSerializer,
+    SalesSeriesReadSerializer,
+    PopularitySerializer,
+    PopularityReadSerializer,
     OrderItemSerializer,
     UserDeliveryInfoSerializer,
     ExternalSerializer
@@ -19,15 +35,44 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAdminUser
+from rest_framework.parsers import MultiPartParser
 from shop import permissions
 from shop import models
+from shop.pagination import ProductCursorPagination, OrderKeysetPagination
+from shop.catalog import (
+    get_catalog_version,
+    get_catalog_snapshot,
+    get_category_counts,
+    delete_products,
+    reprice_products,
+)
+from shop.cart import (
+    read_cart,
+    get_cart_totals,
+    get_cart_version,
+    add_to_cart,
+    apply_cart_operations,
+)
+from shop.checkout import checkout_cart, place_order
+from shop.fulfilment import transition_orders
+from shop.analytics import get_cached, get_sales_series, get_popularity
+from shop.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from shop.conditional import make_etag, not_modified
+from shop.sparse import get_sparse_fields, narrow_queryset
+from shop.importers import FORMATS, guess_format, import_products
+from shop.exporters import FORMATS as EXPORT_FORMATS
+from shop.exporters import CONTENT_TYPES as EXPORT_CONTENT_TYPES
+from shop.exporters import export_orders
 from drf_spectacular.utils import extend_schema,\
-    inline_serializer, PolymorphicProxySerializer
+    inline_serializer, PolymorphicProxySerializer, OpenApiParameter
 from rest_framework import serializers
-from django.db.models import Sum, Count
+from django.db.models import Sum, F
 from django.db.models.functions import ExtractMonth
-from django.db import connection
+from django.db import transaction, DataError
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.http import HttpResponse, StreamingHttpResponse
 import requests
+import codecs
 import json
 import os
 
@@ -44,6 +89,15 @@ class DataAnalysisShopAPIView(APIView):
 
     def get(self, request):
         """Calculate and retrieve backend analysis."""
+        # the products are embedded, so a product write invalidates too.
+        analysis = get_cached(
+            'analysis',
+            {'catalog': get_catalog_version()},
+            self.get_analysis)
+        return Response(analysis, status=status.HTTP_200_OK)
+
+    def get_analysis(self):
+        """Calculate the monthly sales and the popularity metric."""
         sales_per_month = [{"month": "Jan",
                             "sale": 0},
                            {"month": "Feb",
@@ -69,44 +123,80 @@ class DataAnalysisShopAPIView(APIView):
                            {"month": "Dec",
                             "sale": 0},
                            ]
-        monthly_sales = models.Order.objects.annotate(
-            month=ExtractMonth('date_ordered'))\
-            .values('month').annotate(total_sales=Sum('total_price'))
+        # read from the daily rollup, O(days) rather than O(orders).
+        monthly_sales = models.DailySales.objects.annotate(
+            month=ExtractMonth('date'))\
+            .values('month').annotate(total_sales=Sum('revenue'))
         for sale in monthly_sales:
             sales_per_month[sale['month']-1]['sale'] = sale['total_sales']
-        most_popular = models.Product.objects.annotate(
-            num_orderItem=Count('orderitem')).order_by("-num_orderItem")[0]
-        least_popular = models.Product.objects.annotate(
-            num_orderItem=Count('orderitem')).order_by("num_orderItem")[0]
-        count_most = models.OrderItem.objects.filter(
-            product=most_popular).count()
-        count_least = models.OrderItem.objects.filter(
-            product=least_popular).count()
-        serializer_most_popular_product = ProductSerializer(
-            most_popular
-            )
-        serializer_least_popular_product = ProductSerializer(
-            least_popular
-            )
-        most_popular_data = {
-            'most_popular': serializer_most_popular_product.data,
-            'occurance': count_most
-            }
-        least_popular_data = {
-            'least_popular': serializer_least_popular_product.data,
-            'occurance': count_least
-            }
-        popularity_metric = [most_popular_data, least_popular_data]
-        # from O(n+1) to O(6) - achievement note.
-        for sql in enumerate(connection.queries):
-            if sql[0] != 0:
-                print(f'SQL Number {sql[0]}')
-                print(sql[1]['sql'])
-                print("\n")
+        # both ends of the ranking come from one windowed query.
+        popularity = get_popularity(n=1, by='orders')
+        popularity_metric = []
+        if popularity['top']:
+            most_popular = popularity['top'][0]
+            least_popular = popularity['bottom'][0]
+            popularity_metric = [
+                {'most_popular': ProductSerializer(most_popular).data,
+                 'occurance': most_popular.orders},
+                {'least_popular': ProductSerializer(least_popular).data,
+                 'occurance': least_popular.orders},
+                ]
+        return {"sales_per_month": sales_per_month,
+                'popularity_metric': popularity_metric}
 
-        return Response({"sales_per_month": sales_per_month,
-                         'popularity_metric': popularity_metric},
-                        status=status.HTTP_200_OK)
+
+class SalesSeriesAPIView(APIView):
+    """Sales per day, week, month or year between two days"""
+    serializer_class = SalesSeriesSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        parameters=[SalesSeriesSerializer],
+        responses={200: SalesSeriesReadSerializer}
+    )
+    def get(self, request):
+        """Return the orders and revenue per period."""
+        serializer = SalesSeriesSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        params = serializer.validated_data
+        sales = get_cached(
+            'sales',
+            params,
+            lambda: SalesSeriesReadSerializer(
+                get_sales_series(**params)).data)
+        return Response(sales, status=status.HTTP_200_OK)
+
+
+class PopularityAPIView(APIView):
+    """The most and least popular products between two days"""
+    serializer_class = PopularitySerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        parameters=[PopularitySerializer],
+        responses={200: PopularityReadSerializer}
+    )
+    def get(self, request):
+        """Return the top and bottom n products."""
+        serializer = PopularitySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        params = serializer.validated_data
+        popularity = get_cached(
+            'popularity',
+            {**params, 'catalog': get_catalog_version()},
+            lambda: PopularityReadSerializer(
+                get_popularity(**params)).data)
+        return Response(popularity, status=status.HTTP_200_OK)
 
 
 class ListProductViewset(viewsets.ModelViewSet):
@@ -115,14 +205,170 @@ class ListProductViewset(viewsets.ModelViewSet):
     queryset = models.Product.objects.all()
     renderer_classes = [JSONRenderer]
     http_method_names = ['get']
+    pagination_class = ProductCursorPagination
 
     def get_queryset(self):
-        return models.Product.objects.all()
+        return narrow_queryset(
+            models.Product.objects.all(),
+            self.get_serializer())
+
+    def get_serializer(self, *args, **kwargs):
+        """Trim the product fields to the ones asked for."""
+        kwargs.update(get_sparse_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
 
     def list(self, request):
-        products = self.get_queryset().order_by("id")
+        version = get_catalog_version()
+        etag = make_etag('catalog', version)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        # ?cursor=&limit= opts into keyset pagination,
+        # old clients still get the whole catalog.
+        if self.paginator.is_requested(request):
+            products = self.get_queryset().order_by("id")
+            page = self.paginate_queryset(products)
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        elif get_sparse_fields(request):
+            # the snapshot holds every field, trimmed catalogs are queried.
+            products = self.get_queryset().order_by("id")
+            serializer = self.get_serializer(products, many=True)
+            response = Response(serializer.data)
+        else:
+            # the whole catalog is served pre-rendered
+            # from the snapshot cache.
+            response = HttpResponse(
+                get_catalog_snapshot(version),
+                content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class SearchProductAPIView(APIView):
+    """Full-text search over the products in the shop"""
+    serializer_class = ProductSerializer
+    renderer_classes = [JSONRenderer]
+    default_limit = 20
+    max_limit = 100
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'q', str, required=True,
+                description='Search terms, quoted phrases and -exclusions'
+                ),
+            OpenApiParameter(
+                'limit', int,
+                description=f'Maximum results, at most {max_limit}'
+                ),
+        ]
+    )
+    def get(self, request):
+        """Return the products best matching the search terms."""
+        terms = request.query_params.get('q', '').strip()
+        if not terms:
+            return Response(
+                {"Message": "Search terms are required"},
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return Response(
+                {"Message": "Limit must be a number"},
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        limit = max(1, min(limit, self.max_limit))
+        # matching uses the GIN index, ranking and the limit
+        # are applied by postgres to the matches only.
+        query = SearchQuery(terms, search_type='websearch', config='english')
+        products = models.Product.objects\
+            .filter(search_vector=query)\
+            .annotate(rank=SearchRank(F('search_vector'), query))\
+            .order_by('-rank', 'id')\
+            .defer('search_vector')[:limit]
         serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class CategoryProductAPIView(APIView):
+    """Browse products by category with per category counts"""
+    serializer_class = ProductSerializer
+    renderer_classes = [JSONRenderer]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'category', str,
+                description='Only return products in this category'
+                ),
+            OpenApiParameter(
+                'cursor', str,
+                description='Page of the category products to return'
+                ),
+            OpenApiParameter(
+                'limit', int,
+                description='Number of category products per page'
+                ),
+        ],
+        responses={
+            200: inline_serializer(
+                name='category_facets',
+                fields={
+                    'categories': serializers.ListField(
+                        child=inline_serializer(
+                            name='category_count',
+                            fields={
+                                'name': serializers.CharField(),
+                                'count': serializers.IntegerField(),
+                                }
+                            )
+                        ),
+                    'products': ProductSerializer(many=True),
+                    'next': serializers.URLField(allow_null=True),
+                    'previous': serializers.URLField(allow_null=True),
+                    }
+                )
+            }
+    )
+    def get(self, request):
+        """Return the category counts and a page of a category."""
+        params = request.query_params
+        category = params.get('category')
+        version = get_catalog_version()
+        etag = make_etag(
+            'categories',
+            version,
+            category or '',
+            params.get('cursor', ''),
+            params.get('limit', ''))
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        # counts are cached per catalog version instead of grouped per call.
+        categories = get_category_counts(version)
+        products, next_link, previous_link = [], None, None
+        if category:
+            # a page at a time, without the search vector.
+            paginator = ProductCursorPagination()
+            page = paginator.paginate_queryset(
+                narrow_queryset(
+                    models.Product.objects.filter(catagory=category),
+                    ProductSerializer()),
+                request,
+                view=self)
+            products = ProductSerializer(page, many=True).data
+            next_link = paginator.get_next_link()
+            previous_link = paginator.get_previous_link()
+        return Response(
+            {'categories': categories,
+             'products': products,
+             'next': next_link,
+             'previous': previous_link},
+            status=status.HTTP_200_OK,
+            headers={'ETag': etag}
+            )
 
 
 class DestroyProductViewSet(viewsets.ModelViewSet):
@@ -151,6 +397,67 @@ class DestroyProductViewSet(viewsets.ModelViewSet):
                 )
 
 
+class BulkDeleteProductAPIView(APIView):
+    """Allows admin to destroy many products at once"""
+    serializer_class = ProductSelectionSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        responses={
+            200: inline_serializer(
+                name='bulk_delete_products',
+                fields={'deleted': serializers.IntegerField()}
+                )
+            }
+    )
+    def post(self, request):
+        """Destroys the selected products in one transaction."""
+        serializer = ProductSelectionSerializer(data=request.data)
+        if serializer.is_valid():
+            deleted = delete_products(serializer.get_products())
+            return Response({"deleted": deleted}, status=status.HTTP_200_OK)
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+            )
+
+
+class BulkPriceProductAPIView(APIView):
+    """Allows admin to re-price many products at once"""
+    serializer_class = ProductPriceSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        responses={
+            200: inline_serializer(
+                name='bulk_price_products',
+                fields={'updated': serializers.IntegerField()}
+                )
+            }
+    )
+    def post(self, request):
+        """Sets or changes the price of the selected products."""
+        serializer = ProductPriceSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        try:
+            updated = reprice_products(
+                serializer.get_products(),
+                price=serializer.validated_data.get('price'),
+                percent=serializer.validated_data.get('percent'))
+        except DataError:
+            return Response(
+                {"Message": "New prices are out of range"},
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        return Response({"updated": updated}, status=status.HTTP_200_OK)
+
+
 class CreateProduct(APIView):
     """Create product if staff"""
     serializer_class = ProductSerializer
@@ -181,33 +488,84 @@ class CreateProduct(APIView):
                 )
 
 
-class ListCartView(viewsets.ModelViewSet):
-    """Users can view items in cart and edit cart"""
-    serializer_class = CartSerializer
+class ImportProductAPIView(APIView):
+    """Bulk import products from a JSONL or CSV file if staff"""
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    @extend_schema(
+        request={
+            'multipart/form-data': inline_serializer(
+                name='product_import',
+                fields={
+                    'file': serializers.FileField(),
+                    'format': serializers.ChoiceField(
+                        choices=FORMATS, required=False),
+                    }
+                )
+            },
+        responses={
+            200: inline_serializer(
+                name='product_import_report',
+                fields={
+                    'imported': serializers.IntegerField(),
+                    'failed': serializers.IntegerField(),
+                    'aborted': serializers.BooleanField(),
+                    'errors': serializers.ListField(
+                        child=serializers.DictField()),
+                    }
+                )
+            }
+    )
+    def post(self, request):
+        """Import products, reporting the rows that failed."""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {"Message": "A file is required"},
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        format = request.data.get('format') or guess_format(upload.name)
+        if format not in FORMATS:
+            return Response(
+                {"Message": f"Format must be one of {', '.join(FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        # large uploads are spooled to disk and read a line at a time.
+        lines = codecs.iterdecode(upload, 'utf-8-sig')
+        report = import_products(lines, format=format)
+        if report['aborted']:
+            # the rows before the unreadable part are still imported.
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class ListCartView(viewsets.GenericViewSet):
+    """Users can view their cart with its items"""
+    serializer_class = CartReadSerializer
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = (permissions.UpdateOwnCart, )
     queryset = models.Cart.objects.all()
-    http_method_names = ['get',  'patch']
+    http_method_names = ['get']
     renderer_classes = [JSONRenderer]
 
-    def grab_product_from_cart(self, request):
-        """This returns products from cart."""
-        user_cart = models.Cart.objects.filter(user=request.user)
-        serializer = self.serializer_class(user_cart, many=True)
-        # json = JSONRenderer().render(serializer.data)
-        products = serializer.data[0]['products']
-        user_cart_products = models.Product.objects.filter(pk__in=products)
-        products_serialized = ProductSerializer(user_cart_products, many=True)
-
-        return products_serialized.data
-
     def list(self, request):
-        """Returns the list of products in the user's cart"""
-        products = self.grab_product_from_cart(request)
-        user_cart = models.Cart.objects.filter(user=request.user)
-        serializer = self.serializer_class(user_cart, many=True)
-
-        return Response({'id': serializer.data[0]['id'], 'products': products})
+        """Returns the user's cart id with the items in it"""
+        etag = make_etag(
+            'cart',
+            get_cart_version(request.user),
+            get_catalog_version())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        cart_id, cart_items = read_cart(
+            request.user,
+            get_sparse_fields(request))
+        totals = CartTotalsSerializer(get_cart_totals(request.user))
+        return Response(
+            {'id': cart_id, 'items': cart_items, **totals.data},
+            headers={'ETag': etag})
 
 
 class CartItemViewset(viewsets.ModelViewSet):
@@ -217,22 +575,71 @@ class CartItemViewset(viewsets.ModelViewSet):
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = (permissions.UpdateOwnCart, )
 
+    @extend_schema(
+        parameters=[OpenApiParameter(
+            'totals', bool,
+            description='Wrap the items as {items, item_count, total}.')],
+        responses={200: CartItemReadSerializer(many=True)}
+    )
     def list(self, request):
         """Displays user's cart"""
-        # this should be the optimal way only 1 query is done to get user data.
-        # query reduced rom 6 to 2 - achievement note.
-        products = models.CartItem.objects.select_related('product')\
-            .filter(user=request.user)
-        serializer = self.serializer_class(products, many=True)
-        user_cart = []
-        for product in products:
-            serializer = ProductSerializer(product.product)
-            user_cart.append({'cart_item_id': product.id,
-                              'product': serializer.data,
-                              'quantity': product.quantity,
-                              })
-        return Response(user_cart)
+        # cart responses embed products so both versions make up the etag.
+        etag = make_etag(
+            'cart',
+            get_cart_version(request.user),
+            get_catalog_version())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        cart_items = self.get_cart(request)
+        if request.query_params.get('totals') not in ('true', '1'):
+            return Response(cart_items, headers={'ETag': etag})
+        # totals are summed by the database, not from the items above.
+        totals = CartTotalsSerializer(get_cart_totals(request.user))
+        return Response(
+            {'items': cart_items, **totals.data},
+            headers={'ETag': etag})
+
+    def get_cart(self, request):
+        """Return the serialized items in the user's cart."""
+        # the items and their products are read with one JOIN.
+        cart_id, cart_items = read_cart(
+            request.user,
+            get_sparse_fields(request))
+        return cart_items
 
+    @extend_schema(
+        request=CartOperationSerializer(many=True),
+        responses={200: CartItemReadSerializer(many=True)}
+    )
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Apply many add, set and remove operations to the cart at once"""
+        serializer = CartOperationSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        operations = serializer.validated_data
+        product_ids = {operation['product'] for operation in operations}
+        found = set(models.Product.objects
+                    .filter(id__in=product_ids)
+                    .values_list('id', flat=True))
+        if product_ids - found:
+            return Response(
+                {'product': [
+                    f'Product {product_id} does not exist.'
+                    for product_id in sorted(product_ids - found)]},
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        apply_cart_operations(request.user.id, operations)
+        return Response(self.get_cart(request), status=status.HTTP_200_OK)
+
+    @extend_schema(
+        request=CartItemAddSerializer,
+        responses={201: CartItemReadSerializer}
+    )
     def create(self, request):
         """Allows user to post user cart items"""
         # check if user requesting is user
@@ -240,46 +647,25 @@ class CartItemViewset(viewsets.ModelViewSet):
             return Response({'Message': "Unauthorised"},
                             status=status.HTTP_401_UNAUTHORIZED)
         # check request.data is validated
-        serializer = self.serializer_class(data=request.data)
+        serializer = CartItemAddSerializer(data=request.data)
         if serializer.is_valid():
-            # get product id
-            new_product_id = serializer.validated_data['product'].id
-            # this checks if the product already exist in user cart.
-            user_cart = models.CartItem.objects\
-                .select_related('product')\
-                .filter(user=request.user)\
-                .values_list('product')\
-                .filter(product__id=new_product_id)\
-                .count()
-            # if an existing product is found in cart
-            if user_cart >= 1:
-                # do a patch
-                existing_cartItem = models.CartItem.objects\
-                    .select_related('product')\
-                    .filter(user=request.user, product__id=new_product_id)
-                existing_cartItem.update(
-                    quantity=existing_cartItem[0]
-                    .quantity+request.data['quantity'])
-                product = models.Product.objects.get(
-                    pk=existing_cartItem[0].product.pk
-                    )
-                serializer = ProductSerializer(product)
+            # a single upsert adds the product or bumps its quantity,
+            # so concurrent adds can't lose an increment.
+            product = add_to_cart(
+                request.user.id,
+                serializer.validated_data['product'],
+                serializer.validated_data['quantity'])
+            if product is None:
                 return Response(
-                    {'cart_item_id': existing_cartItem[0].id,
-                     'product': serializer.data,
-                     'quantity': existing_cartItem[0].quantity},
-                    status=status.HTTP_201_CREATED)
-            else:
-                # do a post
-                recent_cart_item = serializer.save()
-                product = models.Product.objects.get(
-                    pk=recent_cart_item.product.pk
-                    )
-                serializer = ProductSerializer(product)
-                res = {'cart_item_id': recent_cart_item.id,
-                       'product': serializer.data,
-                       'quantity': recent_cart_item.quantity}
-                return Response(res, status=status.HTTP_201_CREATED)
+                    {'product': ['Product does not exist.']},
+                    status=status.HTTP_400_BAD_REQUEST)
+            serializer = CartItemReadSerializer({
+                'id': product.cart_item_id,
+                'product': product,
+                'quantity': product.cart_item_quantity,
+                'line_total': product.cart_item_line_total,
+            })
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             return Response(
                 serializer.errors,
@@ -305,34 +691,143 @@ class OrderViewset(viewsets.ModelViewSet):
     http_method_names = ['get']
 
     def get_queryset(self):
-        return models.Order.objects.all()
+        # the items with their products are prefetched and the delivery
+        # info joined, so any number of orders costs the same queries.
+        return narrow_queryset(
+            models.Order.objects.order_by("id"),
+            self.get_serializer())
+
+    def get_serializer(self, *args, **kwargs):
+        """Trim the order fields to the ones asked for."""
+        kwargs.update(get_sparse_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
 
     def list(self, request):
         """Display user's list of orders"""
         user = request.user
+        orders = self.get_queryset()
+        # reduced queries from 22 to 1 - achievement note.
+        # how?
+        # I changed the serializer to serializer there instead of ,
+        # manually doing it here.
+        if not user.is_staff:
+            orders = orders.filter(user=user)
+        serializer = self.get_serializer(orders, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
-        if user.is_staff:
-            # reduced queries from 22 to 1 - achievement note.
-            # how?
-            # I changed the serializer to serializer there instead of ,
-            # manually doing it here.
-            all_orders = models.Order.objects\
-                .select_related('user').order_by("id")
-            serializer = OrderReadSerializer(
-                all_orders,
-                many=True
+
+class SearchOrderAPIView(APIView):
+    """Allows admin to search all orders a page at a time"""
+    serializer_class = OrderReadSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [IsAdminUser]
+    pagination_class = OrderKeysetPagination
+
+    @extend_schema(
+        parameters=[
+            OrderSearchSerializer,
+            OpenApiParameter('cursor', str),
+            OpenApiParameter(
+                'limit', int,
+                description='Orders per page, at most '
+                            f'{OrderKeysetPagination.max_page_size}'),
+        ],
+        responses={200: OrderReadSerializer(many=True)}
+    )
+    def get(self, request):
+        """Return a page of the orders matching the filters."""
+        filters = OrderSearchSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(
+                filters.errors,
+                status=status.HTTP_400_BAD_REQUEST
                 )
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        # reduced queries from 20 to 1 - achievement note
-        # I changed the serializer to serialize there instead of ,
-        # manually doing it here.
-        all_user_orders = models.Order.objects\
-            .select_related('user').order_by("id").filter(user=user)
-        serializer = OrderReadSerializer(
-                all_user_orders,
-                many=True
+        sparse = get_sparse_fields(request)
+        orders = narrow_queryset(
+            filters.filter_orders(models.Order.objects.all()),
+            OrderReadSerializer(**sparse))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderReadSerializer(page, many=True, **sparse)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ExportOrderAPIView(APIView):
+    """Allows admin to download orders with their items"""
+    serializer_class = OrderSearchSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        parameters=[
+            OrderSearchSerializer,
+            OpenApiParameter(
+                'export_format', str, enum=EXPORT_FORMATS,
+                description='Output format, jsonl by default'),
+        ],
+        responses={(200, 'application/jsonl'): str, (200, 'text/csv'): str}
+    )
+    def get(self, request):
+        """Stream the orders matching the filters as JSONL or CSV."""
+        format = request.query_params.get('export_format', 'jsonl')
+        if format not in EXPORT_FORMATS:
+            return Response(
+                {"Message":
+                    f"Format must be one of {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
                 )
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        filters = OrderSearchSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(
+                filters.errors,
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        # rows are sent as they are read instead of built in memory.
+        response = StreamingHttpResponse(
+            export_orders(
+                filters.filter_orders(models.Order.objects.all()),
+                format=format),
+            content_type=EXPORT_CONTENT_TYPES[format])
+        response['Content-Disposition'] = \
+            f'attachment; filename="orders.{format}"'
+        return response
+
+
+class BulkStatusOrderAPIView(APIView):
+    """Allows admin to change the delivery status of many orders"""
+    serializer_class = OrderStatusSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        responses={
+            200: inline_serializer(
+                name='bulk_status_orders',
+                fields={
+                    'updated': serializers.ListField(
+                        child=serializers.IntegerField()),
+                    'skipped': serializers.ListField(
+                        child=serializers.IntegerField()),
+                    }
+                )
+            }
+    )
+    def post(self, request):
+        """Moves the orders still in from_status to to_status."""
+        serializer = OrderStatusSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        # one UPDATE, orders changed by someone else meanwhile are skipped.
+        updated, skipped = transition_orders(
+            serializer.validated_data['ids'],
+            serializer.validated_data['from_status'],
+            serializer.validated_data['to_status'])
+        return Response(
+            {"updated": updated, "skipped": skipped},
+            status=status.HTTP_200_OK)
 
 
 class UserDeliveryInfoViewset(viewsets.ModelViewSet):
@@ -354,17 +849,13 @@ class UserDeliveryInfoViewset(viewsets.ModelViewSet):
                                           serializers.CharField(
                                               allow_blank=True
                                               ),
-                                      "total_price":
-                                          serializers.DecimalField(
-                                              max_digits=5,
-                                              decimal_places=2
-                                              ),
                                           }
                                   ),
                 ],
             resource_type_field_name='type',
             many=True
             ),
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
         responses={
             '2XX': inline_serializer(
                 name='Order_success_user',
@@ -374,6 +865,7 @@ class UserDeliveryInfoViewset(viewsets.ModelViewSet):
                 )
             }
     )
+    @idempotent
     def create(self, request):
         """Create delivery info and order"""
         user = request.user
@@ -384,53 +876,30 @@ class UserDeliveryInfoViewset(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN)
         # process the data and check if user inputted right data
         serializer = self.serializer_class(data=request.data[0])
-        if serializer.is_valid():
-            # create the deliveryInfo
-            delivery_info_obj = serializer.save()
-            user_cart = models.CartItem.objects\
-                .select_related('user')\
-                .filter(user=user)
-            email = request.data[0]['email']
-            new_orderitems = [{
-                        'user': user.id,
-                        'email': email,
-                        'product': cart_item.product.id,
-                        'quantity': cart_item.quantity,
-                    } for cart_item in user_cart]
-            orderitem_serializer = OrderItemSerializer(
-                data=new_orderitems, many=True)
-            if orderitem_serializer.is_valid():
-                new_orderitems_obj = orderitem_serializer.save()
-                orderItem_ids = [
-                    new_orderItem.id for new_orderItem in new_orderitems_obj]
-                new_order_serializer = OrderSerializer(data={
-                    'user': user.id,
-                    'email': email,
-                    'order': orderItem_ids,
-                    'personal_info_used': delivery_info_obj.id,
-                    'delivery_instructions': request.data[1]['delivery_msg'],
-                    'total_price': request.data[1]['total_price']
-                })
-                if new_order_serializer.is_valid():
-                    new_order_serializer.save()
-                    old_cartItems = models.CartItem.objects.filter(user=user)
-                    old_cartItems.delete()
-                    return Response(
-                        new_order_serializer.data,
-                        status=status.HTTP_201_CREATED)
-                else:
-                    return Response(
-                        new_order_serializer.errors,
-                        status=status.HTTP_400_BAD_REQUEST)
-            else:
-                return Response(
-                    orderitem_serializer.errors,
-                    status=status.HTTP_400_BAD_REQUEST)
-        else:
+        if not serializer.is_valid():
             return Response(
                 serializer.errors,
                 status=status.HTTP_400_BAD_REQUEST
                 )
+        checkout_serializer = CheckoutSerializer(data=request.data[1])
+        if not checkout_serializer.is_valid():
+            return Response(
+                checkout_serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST)
+        # the whole cart is ordered and cleared in one transaction
+        # with the same number of queries however big it is.
+        order = checkout_cart(
+            user,
+            request.data[0]['email'],
+            serializer,
+            checkout_serializer.validated_data)
+        if order is None:
+            return Response(
+                {'order': ['This list may not be empty.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            OrderSerializer(order).data,
+            status=status.HTTP_201_CREATED)
 
 
 class PostOrderAnonymousAPIView(APIView):
@@ -447,10 +916,6 @@ class PostOrderAnonymousAPIView(APIView):
                     fields={
                         "delivery_msg":
                             serializers.CharField(allow_blank=True),
-                        "total_price": serializers.DecimalField(
-                            max_digits=5,
-                            decimal_places=2
-                            ),
                         }
                     ),
                 inline_serializer(
@@ -460,7 +925,7 @@ class PostOrderAnonymousAPIView(APIView):
                             child=inline_serializer(
                                 name="user_items_anonymous",
                                 fields={
-                                    "product_ids":
+                                    "product_id":
                                         serializers.IntegerField(min_value=1),
                                     "quantity":
                                         serializers.IntegerField(min_value=1),
@@ -473,76 +938,105 @@ class PostOrderAnonymousAPIView(APIView):
             resource_type_field_name='type',
             many=True,
             ),
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
         responses={
             '2XX':
                 inline_serializer(
                     name='Order_success_anonymous',
                     fields={
                         "message":
-                            serializers.CharField()
+                            serializers.CharField(),
+                        "order": serializers.IntegerField(),
+                        "token": serializers.CharField(),
                             }
                     )
                 }
     )
+    @idempotent
     def post(self, request):
         """Post orders anonymously."""
 
         email = request.data[0]['email']
-        user_cartItems = request.data[2]['products']
         serializer = self.serializer_class(data=request.data[0])
-        if serializer.is_valid():
-            # now that the delivery info is valid
-            # create the orderitems and attach the email to it.
-            # a email is required so issues with their order can be heard
-            # email can be used to find their order.
-            # I think this is possible
-            store_orders = []
-            for cartItem in user_cartItems:
-                product = cartItem['product_id']
-                quantity = cartItem['quantity']
-                serializer = OrderItemSerializer(
-                    data={
-                        "email": email,
-                        "product": product,
-                        "quantity": quantity
-                        }
-                    )
-                if serializer.is_valid():
-                    new_orderItem = serializer.save()
-                    store_orders.append(new_orderItem.id)
-                else:
-                    return Response(
-                        serializer.errors,
-                        status=status.HTTP_400_BAD_REQUEST
-                        )
-            serializer = self.serializer_class(data=request.data[0])
-            if serializer.is_valid():
-                new_delivery_info = serializer.save()
-                serializer = OrderSerializer(
-                    data={
-                        "email": email,
-                        "personal_info_used": new_delivery_info.id,
-                        "order": store_orders,
-                        "delivery_instructions":
-                            request.data[1]["delivery_msg"],
-                        "total_price":
-                            request.data[1]["total_price"]
-                        }
-                    )
-                if serializer.is_valid():
-                    serializer.save()
-                    return Response({"message": "Order Successful"})
-                else:
-                    return Response(
-                        serializer.errors,
-                        status=status.HTTP_400_BAD_REQUEST
-                        )
-        else:
+        if not serializer.is_valid():
             return Response(
                 serializer.errors,
                 status=status.HTTP_400_BAD_REQUEST
                 )
-        return Response({"message": "hello"})
+        checkout_serializer = CheckoutSerializer(data=request.data[1])
+        if not checkout_serializer.is_valid():
+            return Response(
+                checkout_serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST)
+        cart_serializer = AnonymousCartSerializer(data=request.data[2])
+        if not cart_serializer.is_valid():
+            return Response(
+                cart_serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST)
+        lines = [(item['product_id'], item['quantity'])
+                 for item in cart_serializer.validated_data['products']]
+        # every product is checked and priced with one query, not one
+        # per line.
+        product_ids = {product_id for product_id, _ in lines}
+        prices = dict(models.Product.objects
+                      .filter(id__in=product_ids)
+                      .values_list('id', 'price'))
+        if product_ids - prices.keys():
+            return Response(
+                {'product': [
+                    f'Product {product_id} does not exist.'
+                    for product_id in sorted(product_ids - prices.keys())]},
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        # a email is required so issues with their order can be heard
+        # email can be used to find their order, with the token
+        # returned here.
+        with transaction.atomic():
+            order = place_order(
+                None,
+                email,
+                serializer,
+                lines,
+                sum(prices[product_id] * quantity
+                    for product_id, quantity in lines),
+                checkout_serializer.validated_data)
+        return Response({
+            "message": "Order Successful",
+            "order": order.id,
+            "token": order.token,
+            })
+
+
+class TrackOrderAPIView(APIView):
+    """Allows anonymous users to find their order"""
+    serializer_class = OrderTrackSerializer
+
+    @extend_schema(
+        request=OrderTrackSerializer,
+        responses={200: OrderReadSerializer}
+    )
+    def post(self, request):
+        """Return the order placed with the email and token."""
+        serializer = OrderTrackSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+                )
+        sparse = get_sparse_fields(request)
+        # served by the (email, token) index.
+        order = narrow_queryset(
+            models.Order.objects.filter(
+                email=serializer.validated_data['email'],
+                token=serializer.validated_data['token']),
+            OrderReadSerializer(**sparse)).first()
+        if order is None:
+            return Response(
+                {"Message": "Order not found"},
+                status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            OrderReadSerializer(order, **sparse).data,
+            status=status.HTTP_200_OK)
 
 
 class ExternalAPIView(APIView):
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'shop',
     'rest_framework',
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryInstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -120,6 +122,21 @@ DATABASES = {
     }
 }
 
+# analytics are shared by every uwsgi worker so that one computes a
+# result for all of them, the table is made by createcachetable.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'shop_analytics_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -170,4 +187,32 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS':'drf_spectacular.openapi.AutoSchema',
-}
\ No newline at end of file
+}
+
+# seconds analytics results are cached for, order writes invalidate
+# them sooner.
+SHOP_ANALYTICS_CACHE_TTL = int(os.environ.get('SHOP_ANALYTICS_CACHE_TTL', 300))
+
+# share of requests whose queries are counted, timed and logged, off
+# unless configured, and how many of their slowest statements are kept.
+QUERY_INSTRUMENTATION_SAMPLE_RATE = float(
+    os.environ.get('QUERY_INSTRUMENTATION_SAMPLE_RATE', 0))
+QUERY_INSTRUMENTATION_SLOWEST = int(
+    os.environ.get('QUERY_INSTRUMENTATION_SLOWEST', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('QUERY_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
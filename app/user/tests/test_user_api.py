@@ -141,6 +141,21 @@ class PrivateUserApiTests(TestCase):
             'user_status': 'member',
         })
 
+    def test_retrieve_profile_not_modified(self):
+        """Test profile is not resent while it is unchanged."""
+        res = self.client.get(ME_URL)
+        etag = res['ETag']
+
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(ME_URL, {'name': 'Updated name'})
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
     def test_post_me_not_allowed(self):
         """Test POST is not allowed for the me endpoint."""
         res = self.client.post(ME_URL, {})
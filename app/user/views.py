@@ -1,11 +1,14 @@
 """
 Views for the user API.
 """
+import hashlib
+
 from rest_framework import generics, authentication, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 from rest_framework.response import Response
 
+from shop.conditional import make_etag, not_modified
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
@@ -41,5 +44,16 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
         user_status = "member"
         if (request.user.is_staff):
             user_status = "staff"
+        # the user row is already loaded by authentication,
+        # so the etag costs no extra query.
+        etag = make_etag(
+            'user',
+            user_id,
+            hashlib.md5(f'{name}:{email}:{user_status}'.encode())
+            .hexdigest())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
         return Response({"name": name, "email": email,
-                        "user_id": user_id, "user_status": user_status})
+                        "user_id": user_id, "user_status": user_status},
+                        headers={'ETag': etag})